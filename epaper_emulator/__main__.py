@@ -0,0 +1,5 @@
+import sys
+
+from epaper_emulator.cli import main
+
+sys.exit(main())
@@ -0,0 +1,181 @@
+"""Command-line interface for the EPD emulator.
+
+Usage:
+    epaper-emulator render my_screens.py:draw --models all --out gallery/
+    epaper-emulator replay session.epdrec --speed 4
+
+``render`` calls a function that takes an ``EPD`` and draws on it, once per
+combination of model, orientation and color mode. Each run happens headless
+in a process pool and writes the frame as PNG and/or Waveshare buffer, plus
+a ``stats.json`` with timings for every job.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import importlib
+import importlib.util
+import itertools
+import json
+import os
+import sys
+import time
+
+from epaper_emulator.emulator import EPD, currentdir
+
+ORIENTATIONS = ('normal', 'reversed')
+MODES = ('mono', 'color', 'gray')
+FORMATS = ('png', 'bin')
+
+_loaded_targets = {}
+
+
+def available_models():
+    """Names of all bundled model configs."""
+    paths = glob.glob(os.path.join(currentdir, 'config', '*.json'))
+    return sorted(os.path.splitext(os.path.basename(path))[0] for path in paths)
+
+
+def load_target(target):
+    """Resolve ``module:function`` or ``path/to/script.py:function`` to a callable."""
+    if target in _loaded_targets:
+        return _loaded_targets[target]
+    location, sep, name = target.rpartition(':')
+    if not sep or not location or not name:
+        raise ValueError(f"Render target must look like module:function, got {target!r}")
+    if location.endswith('.py') or os.sep in location:
+        spec = importlib.util.spec_from_file_location(
+            f"_epaper_render_{len(_loaded_targets)}", location
+        )
+        if spec is None:
+            raise ValueError(f"Cannot load render script {location!r}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        # Console scripts don't put the working directory on sys.path
+        if os.getcwd() not in sys.path:
+            sys.path.insert(0, os.getcwd())
+        module = importlib.import_module(location)
+    function = getattr(module, name)
+    _loaded_targets[target] = function
+    return function
+
+
+def supports_mode(model, mode):
+    with open(os.path.join(currentdir, 'config', f'{model}.json')) as f:
+        config = json.load(f)
+    return mode != 'gray' or config.get('gray_levels', 2) == 4
+
+
+def render_job(target, model, orientation, mode, out_dir, formats):
+    """Render one model/orientation/mode combination. Runs in a worker process."""
+    name = f"{model}_{orientation}_{mode}"
+    result = {'name': name, 'model': model, 'orientation': orientation, 'mode': mode}
+    start = time.perf_counter()
+    try:
+        epd = EPD(
+            config_file=model, headless=True,
+            use_color=mode == 'color', use_gray=mode == 'gray',
+            reverse_orientation=orientation == 'reversed',
+        )
+        setup = time.perf_counter()
+        load_target(target)(epd)
+        buffer = epd.get_frame_buffer(None)
+        rendered = time.perf_counter()
+
+        files = []
+        if 'png' in formats:
+            path = os.path.join(out_dir, f"{name}.png")
+            epd.image.save(path)
+            files.append(path)
+        if 'bin' in formats:
+            path = os.path.join(out_dir, f"{name}.bin")
+            with open(path, 'wb') as f:
+                f.write(buffer)
+            files.append(path)
+        result.update(
+            width=epd.width, height=epd.height, files=files,
+            setup_seconds=setup - start,
+            render_seconds=rendered - setup,
+            total_seconds=time.perf_counter() - start,
+        )
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def _split(value, choices, option):
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    if items == ['all']:
+        return list(choices)
+    unknown = sorted(set(items) - set(choices))
+    if unknown:
+        raise SystemExit(f"Unknown {option}: {', '.join(unknown)}")
+    return items
+
+
+def render(args):
+    models = _split(args.models, available_models(), 'model')
+    orientations = _split(args.orientations, ORIENTATIONS, 'orientation')
+    modes = _split(args.modes, MODES, 'mode')
+    formats = _split(args.formats, FORMATS, 'format')
+    os.makedirs(args.out, exist_ok=True)
+
+    jobs = [
+        (args.target, model, orientation, mode, args.out, formats)
+        for model, orientation, mode in itertools.product(models, orientations, modes)
+        if supports_mode(model, mode)
+    ]
+    start = time.perf_counter()
+    if args.jobs == 1:
+        results = [render_job(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            results = list(pool.map(render_job, *zip(*jobs))) if jobs else []
+    elapsed = time.perf_counter() - start
+
+    with open(os.path.join(args.out, 'stats.json'), 'w') as f:
+        json.dump({'total_seconds': elapsed, 'jobs': results}, f, indent=2)
+    failed = [result for result in results if 'error' in result]
+    for result in failed:
+        print(f"{result['name']}: {result['error']}", file=sys.stderr)
+    print(f"Rendered {len(results) - len(failed)}/{len(results)} jobs in {elapsed:.2f}s to {args.out}")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='epaper-emulator', description="Waveshare EPD emulator tools.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    render_parser = commands.add_parser(
+        'render', help="render a drawing function headlessly across models",
+    )
+    render_parser.add_argument('target', help="module:function or script.py:function taking an EPD")
+    render_parser.add_argument('--models', default='all', help="comma-separated model names, or 'all'")
+    render_parser.add_argument('--orientations', default='normal', help="normal, reversed, or 'all'")
+    render_parser.add_argument('--modes', default='mono', help="mono, color, gray, or 'all'")
+    render_parser.add_argument('--formats', default='png', help="png, bin, or 'all'")
+    render_parser.add_argument('--out', default='render', help="output directory")
+    render_parser.add_argument('--jobs', type=_positive_int, default=os.cpu_count() or 1,
+                               help="worker processes, 1 to render in-process")
+
+    commands.add_parser('replay', help="replay a recorded session", add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command == 'replay':
+        from epaper_emulator.recording import main as replay_main
+        return replay_main(rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    return render(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
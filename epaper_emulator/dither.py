@@ -0,0 +1,122 @@
+"""Conversion of pasted images to what the panel can actually show.
+
+Every step runs as a whole-image Pillow operation (convert, quantize,
+ImageChops), never as a per-pixel Python loop. Results are cached by a hash
+of the source pixels, so pasting the same photo again is a lookup.
+"""
+
+import hashlib
+
+from PIL import Image, ImageChops, ImageColor
+
+from epaper_emulator.cache import LRUCache
+
+NONE = 'none'
+ORDERED = 'ordered'
+FLOYD_STEINBERG = 'floyd-steinberg'
+METHODS = (NONE, ORDERED, FLOYD_STEINBERG)
+
+# 8x8 Bayer index matrix, values 0..63
+_BAYER_8 = (
+    (0, 32, 8, 40, 2, 34, 10, 42),
+    (48, 16, 56, 24, 50, 18, 58, 26),
+    (12, 44, 4, 36, 14, 46, 6, 38),
+    (60, 28, 52, 20, 62, 30, 54, 22),
+    (3, 35, 11, 43, 1, 33, 9, 41),
+    (51, 19, 59, 27, 49, 17, 57, 25),
+    (15, 47, 7, 39, 13, 45, 5, 37),
+    (63, 31, 55, 23, 61, 29, 53, 21),
+)
+
+_cache = LRUCache(16 << 20)
+
+
+def parse_palette(colors):
+    """Resolve a list of color names or hex strings to RGB tuples."""
+    return tuple(ImageColor.getrgb(color)[:3] for color in colors)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _threshold_map(size):
+    """An 'L' image tiling the Bayer matrix, scaled to thresholds in 0..255."""
+    width, height = size
+    rows = []
+    for bayer_row in _BAYER_8:
+        row = bytes(value * 4 + 2 for value in bayer_row)
+        rows.append((row * (width // 8 + 1))[:width])
+    data = b''.join(rows[y % 8] for y in range(height))
+    return Image.frombytes('L', size, data)
+
+
+def _palette_image(palette):
+    image = Image.new('P', (1, 1))
+    image.putpalette([channel for color in palette for channel in color])
+    return image
+
+
+def _to_monochrome(image, method):
+    if method == FLOYD_STEINBERG:
+        # Same result as the implicit conversion done by Image.paste()
+        return image.convert('1', dither=Image.Dither.FLOYDSTEINBERG)
+    gray = image.convert('L')
+    if method == ORDERED:
+        # A pixel is white where it is brighter than its Bayer threshold
+        gray = ImageChops.subtract(gray, _threshold_map(gray.size))
+        return gray.point(lambda v: 255 if v else 0, '1')
+    return gray.point(lambda v: 255 if v >= 128 else 0, '1')
+
+
+def _to_palette(image, palette, method):
+    image = image.convert('RGB')
+    dither = Image.Dither.NONE
+    if method == FLOYD_STEINBERG:
+        dither = Image.Dither.FLOYDSTEINBERG
+    elif method == ORDERED:
+        # Shift each channel by a Bayer offset as wide as the gap between the
+        # palette's shades, then snap to the nearest palette color
+        levels = max(len({color[band] for color in palette}) for band in range(3))
+        step = max(levels - 1, 1)
+        offsets = _threshold_map(image.size).point(lambda v: 128 + (v - 128) // step)
+        image = ImageChops.add(image, offsets.convert('RGB'), 1.0, -128)
+    return image.quantize(palette=_palette_image(palette), dither=dither).convert('RGB')
+
+
+def convert(image, mode, palette=None, method=FLOYD_STEINBERG):
+    """Convert ``image`` for a framebuffer in ``mode``.
+
+    Monochrome ('1') targets are dithered to black and white. 'RGB' and 'L'
+    targets with a ``palette`` (a tuple of RGB tuples) are reduced to those
+    colors; without one the image is only converted to the target mode.
+    ``method`` is one of ``METHODS``.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown dither method {method!r}, expected one of {METHODS}")
+    if image.mode == mode and palette is None:
+        return image
+    if mode != '1' and palette is None:
+        return image.convert(mode)
+
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    if image.mode in ('P', 'PA'):
+        # The pixels are only palette indices; the colors live in the palette
+        digest.update(bytes(image.getpalette() or ()))
+        digest.update(repr(image.info.get('transparency')).encode())
+    digest = digest.digest()
+    key = (digest, image.mode, image.size, mode, palette, method)
+    converted = _cache.get(key)
+    if converted is None:
+        if mode == '1':
+            converted = _to_monochrome(image, method)
+        else:
+            converted = _to_palette(image, palette, method)
+            if converted.mode != mode:
+                converted = converted.convert(mode)
+        _cache.put(key, converted, converted.width * converted.height * len(converted.getbands()))
+    return converted
@@ -1,12 +1,30 @@
+import base64
+from collections import deque
 import json
-from PIL import Image, ImageDraw
+from PIL import Image, ImageColor, ImageDraw, ImageFont
 import io
 import os
 import threading
 import time
 
+from epaper_emulator import dither as _dither
+from epaper_emulator.cache import LRUCache
+from epaper_emulator.framebuffer import (
+    BITS_PER_PIXEL, GRAY_LEVELS, GRAY_QUANTIZE, PackedFramebuffer, blit_rows,
+    buffer_to_image, dirty_rect, pack_gray, pixels_per_byte, row_stride, unpack_gray,
+    window_bytes,
+)
+from epaper_emulator.segments import SegmentedPanel
+from epaper_emulator.sharedmem import SharedFramebuffer
+
 currentdir = os.path.dirname(os.path.realpath(__file__))
 
+# Rendered text shared by all EPD instances that don't ask for their own cache
+_text_cache = LRUCache(1 << 20)
+# Default fonts by requested size, so repeated /draw commands reuse one font object
+_default_fonts = {}
+_MAX_DEFAULT_FONTS = 32
+
 
 class _BatchContext:
     """Context manager that suppresses display() calls until the block exits."""
@@ -20,41 +38,281 @@ class _BatchContext:
 
     def __exit__(self, *exc):
         self._epd._batching = False
-        self._epd.display(self._epd.getbuffer(self._epd.image))
+        self._epd._refresh()
         return False
 
 
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _xy(value, counts=None):
+    """Flatten JSON coordinates ([x0, y0, x1, y1] or [[x0, y0], ...]) for Pillow.
+
+    ``counts`` limits the number of values accepted.
+    """
+    if not isinstance(value, (list, tuple)):
+        raise ValueError(f"Invalid coordinates: {value!r}")
+    flat = []
+    for item in value:
+        if isinstance(item, (list, tuple)):
+            flat.extend(item)
+        else:
+            flat.append(item)
+    if not flat or not all(_number(v) for v in flat):
+        raise ValueError(f"Invalid coordinates: {value!r}")
+    if counts is not None and len(flat) not in counts:
+        raise ValueError(f"Expected {' or '.join(map(str, counts))} coordinates, got {value!r}")
+    return tuple(flat)
+
+
+def _box(value):
+    """Coordinates of a rectangle, ellipse or paste box: x0, y0, x1, y1 with x1 >= x0 and y1 >= y0."""
+    box = _xy(value, (4,))
+    if box[2] < box[0] or box[3] < box[1]:
+        raise ValueError(f"Box {value!r} must have x1 >= x0 and y1 >= y0")
+    return box
+
+
+def _color(value):
+    """Check a JSON color and convert it for Pillow, which expects RGB colors as tuples."""
+    if value is None or _number(value):
+        return value
+    if isinstance(value, str):
+        ImageColor.getrgb(value)  # Raises ValueError for unknown names
+        return value
+    if isinstance(value, list) and len(value) in (3, 4) and all(
+            isinstance(v, int) and not isinstance(v, bool) for v in value):
+        return tuple(value)
+    raise ValueError(f"Invalid color: {value!r}")
+
+
+def _font_key(font):
+    """Cache key for a font.
+
+    TrueType fonts loaded from a file are keyed by file, size and face, and
+    default fonts from _load_font() by their size, so neither keeps the font
+    object alive in the cache. Other fonts are keyed by the object itself.
+    """
+    path = getattr(font, 'path', None)
+    if isinstance(path, str):
+        return (path, font.size, font.index, font.layout_engine)
+    for size, default in _default_fonts.items():
+        if default is font:
+            return ('default', size)
+    return font
+
+
+def _load_font(size):
+    """Pillow's default font at ``size``, loaded once per size."""
+    font = _default_fonts.get(size)
+    if font is not None:
+        return font
+    if size is None:
+        font = ImageFont.load_default()
+    else:
+        try:
+            font = ImageFont.load_default(size=size)
+        except TypeError:  # Pillow < 10.1 has no sized default font
+            font = ImageFont.load_default()
+    if len(_default_fonts) < _MAX_DEFAULT_FONTS:
+        _default_fonts[size] = font
+    return font
+
+
+def _decode_image(data):
+    """Open an encoded (PNG, JPEG, ...) image from bytes and load it fully."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Cannot decode image: {e}") from e
+    return image
+
+
+def _parse_command(command):
+    """Validate one JSON drawing command.
+
+    Returns a function that applies the command to an EPD while its lock is
+    held, so a whole batch can be checked before anything is drawn.
+    """
+    if not isinstance(command, dict):
+        raise ValueError(f"Drawing command must be an object, got {command!r}")
+    op = command.get('op')
+    if op == 'clear':
+        fill = _color(command.get('fill', 255))
+        return lambda epd: epd.image.paste(fill, (0, 0, epd.width, epd.height))
+    if op == 'text':
+        xy = _xy(command.get('xy', []), (2,))
+        text = str(command.get('text', ''))
+        size = command.get('size')
+        if size is not None and (not _number(size) or size <= 0):
+            raise ValueError(f"Invalid font size: {size!r}")
+        font = _load_font(size)
+        fill = _color(command.get('fill', 0))
+        return lambda epd: epd._draw_text(xy, text, font, fill)
+    if op in ('rectangle', 'ellipse'):
+        xy = _box(command.get('xy', []))
+        outline = _color(command.get('outline'))
+        fill = _color(command.get('fill'))
+        method = op
+        return lambda epd: getattr(epd.draw, method)(xy, outline=outline, fill=fill)
+    if op == 'line':
+        xy = _xy(command.get('xy', []))
+        if len(xy) < 4 or len(xy) % 2:
+            raise ValueError(f"A line needs at least two points, got {command.get('xy')!r}")
+        fill = _color(command.get('fill'))
+        width = command.get('width', 0)
+        if not isinstance(width, int) or isinstance(width, bool) or width < 0:
+            raise ValueError(f"Invalid line width: {width!r}")
+        return lambda epd: epd.draw.line(xy, fill=fill, width=width)
+    if op == 'image':
+        try:
+            data = base64.b64decode(command.get('data', ''), validate=True)
+        except ValueError as e:
+            raise ValueError(f"Invalid base64 image data: {e}") from e
+        image = _decode_image(data)
+        box = None
+        if 'box' in command:
+            box = _xy(command['box'], (2, 4))
+            if len(box) == 4 and (box[2] - box[0], box[3] - box[1]) != image.size:
+                raise ValueError(f"Box {command['box']!r} does not match the image size {image.size}")
+        return lambda epd: epd.image.paste(epd._convert_for_panel(image), box)
+    raise ValueError(f"Unknown drawing op: {op!r}")
+
+
 class EPD:
+    # Waveshare 4-gray shades, from white to black
+    GRAY1 = GRAY_LEVELS[3]
+    GRAY2 = GRAY_LEVELS[2]
+    GRAY3 = GRAY_LEVELS[1]
+    GRAY4 = GRAY_LEVELS[0]
+
     def __init__(self, config_file="epd2in13", use_tkinter=False,
                  use_color=False, update_interval=2,
-                 reverse_orientation=False, port=5000):
+                 reverse_orientation=False, port=5000, compact=False,
+                 text_cache_size=None, dither=_dither.FLOYD_STEINBERG,
+                 use_gray=False, shared_framebuffer=None, headless=False):
         config_path = os.path.join(currentdir, 'config', f'{config_file}.json')
+        self.config_name = config_file
         self.load_config(config_path)
 
+        if use_gray and use_color:
+            raise ValueError("use_gray and use_color are mutually exclusive")
+        if use_gray and self.gray_levels != 4:
+            raise ValueError(f"{config_file} does not support 4-gray mode")
         self.use_color = use_color
-        self.image_mode = 'RGB' if self.use_color else '1'
+        self.use_gray = use_gray
+        if self.use_gray:
+            self.image_mode = 'L'
+        else:
+            self.image_mode = 'RGB' if self.use_color else '1'
 
         if reverse_orientation:
             self.width, self.height = self.height, self.width
 
-        self.image = Image.new(
-            self.image_mode, (self.width, self.height),
-            'white' if self.use_color else 255
-        )
+        if compact and self.use_color:
+            raise ValueError("compact storage is only available for monochrome and grayscale panels")
+        self.compact = compact
+        self._image = None
+        self._draw = None
+        if self.compact:
+            self.framebuffer = PackedFramebuffer(
+                self.width, self.height, 255, bits=2 if self.use_gray else 1
+            )
+        else:
+            self.framebuffer = None
+            self.image = Image.new(
+                self.image_mode, (self.width, self.height),
+                'white' if self.use_color else 255
+            )
+        # Segment boxes are given in the panel's native orientation
+        if self.segment_boxes and not reverse_orientation:
+            self.segments = SegmentedPanel(self.segment_boxes, self.width, self.height, self.image_mode)
+        else:
+            self.segments = None
         self.use_tkinter = use_tkinter
+        self.headless = headless
         self.update_interval = update_interval
         self.port = port
         self._lock = threading.Lock()
         self._batching = False
+        # Viewer bookkeeping: a counter of refreshes and the windows they touched
+        self._generation = 0
+        self._tk_generation = 0
+        self._updates = deque(maxlen=64)
+        self._png_dirty = True
+        self._image_bytes = None
+        # Buffer last shown by displayPartBaseImage()/displayPartial()
+        self._part_base = None
+        if text_cache_size is None:
+            self.text_cache = _text_cache
+        else:
+            self.text_cache = LRUCache(text_cache_size) if text_cache_size else None
+        if dither not in _dither.METHODS:
+            raise ValueError(f"Unknown dither method {dither!r}, expected one of {_dither.METHODS}")
+        self.dither = dither
+        self.recorder = None
+        self.shared = None
+        if shared_framebuffer is not None:
+            self.shared = SharedFramebuffer(
+                shared_framebuffer, self.width, self.height, self.image_mode
+            )
+            self.shared.publish(self.get_frame_buffer(None))
 
-        if self.use_tkinter:
+        if self.headless:
+            pass  # No viewer, frames are only reachable through the API
+        elif self.use_tkinter:
             self.init_tkinter()
         else:
-            self.update_image_bytes()
+            # The PNG is encoded when the page asks for it, see image_bytes
             self.init_flask()
-            self.start_image_update_loop()
 
-        self.draw = ImageDraw.Draw(self.image)
+    @property
+    def image(self):
+        """The Pillow image to draw on.
+
+        In compact mode the image only exists between the first drawing
+        operation and the next display() call, which packs it back into
+        ``framebuffer`` and releases it.
+        """
+        if self._image is None:
+            self._image = self.framebuffer.to_image()
+        return self._image
+
+    @image.setter
+    def image(self, value):
+        self._image = value
+        self._draw = None
+
+    @property
+    def draw(self):
+        if self._draw is None:
+            self._draw = ImageDraw.Draw(self.image)
+        return self._draw
+
+    @draw.setter
+    def draw(self, value):
+        self._draw = value
+
+    def _commit(self):
+        """Pack pending drawing back into the compact framebuffer. Caller holds the lock."""
+        if self.framebuffer is not None and self._image is not None:
+            self.framebuffer.load_image(self._image)
+            self._image = None
+            self._draw = None
+        elif self.use_gray:
+            # Snap anti-aliasing and arbitrary fills to the four panel shades
+            self.image.paste(self.image.point(GRAY_QUANTIZE))
+
+    def _frame_image(self):
+        """Image of the current frame for the viewers. Caller holds the lock."""
+        if self._image is not None:
+            return self._image
+        return self.framebuffer.to_image()
+
+    def _refresh(self):
+        self.display(self.get_frame_buffer(None))
 
     def load_config(self, config_file):
         with open(config_file, 'r') as f:
@@ -63,6 +321,10 @@ class EPD:
             self.height = config.get('height', 250)
             self.color = config.get('color', 'white')
             self.text_color = config.get('text_color', 'black')
+            self.gray_levels = config.get('gray_levels', 2)
+            palette = config.get('palette')
+            self.palette = _dither.parse_palette(palette) if palette else None
+            self.segment_boxes = config.get('segments')
 
     def init_tkinter(self):
         import tkinter as tk
@@ -76,16 +338,53 @@ class EPD:
             self.root, width=self.width, height=self.height
         )
         self.canvas.pack()
-        self.tk_image = ImageTk.PhotoImage(self.image)
+        with self._lock:
+            self.tk_image = ImageTk.PhotoImage(self._frame_image())
         self.image_on_canvas = self.canvas.create_image(
             0, 0, anchor=tk.NW, image=self.tk_image
         )
 
         self.update_tkinter()
 
+    def _frame_region(self, rect):
+        """Image of one window of the current frame. Caller holds the lock."""
+        if self._image is not None or self.framebuffer is None:
+            return self.image.crop(rect)
+        x0, y0, x1, y1 = rect
+        rows = buffer_to_image(self._current_rows(y0, y1), (self.width, y1 - y0), self.image_mode)
+        return rows.crop((x0, 0, x1, y1 - y0))
+
+    def _push(self, rect=None):
+        """Show the committed frame in the viewer, either whole or just ``rect``."""
+        if self.headless:
+            return
+        if self.use_tkinter:
+            with self._lock:
+                self._generation += 1
+                self._tk_generation = self._generation
+                if rect is None:
+                    self.tk_image = self.ImageTk.PhotoImage(self._frame_image())
+                    self.canvas.itemconfig(self.image_on_canvas, image=self.tk_image)
+                else:
+                    window = self.ImageTk.PhotoImage(self._frame_region(rect))
+                    self.root.tk.call(str(self.tk_image), 'copy', str(window), '-to', rect[0], rect[1])
+            self.root.update()
+        else:
+            with self._lock:
+                self._generation += 1
+                self._updates.append((self._generation, rect))
+                self._png_dirty = True
+
     def update_tkinter(self):
-        self.tk_image = self.ImageTk.PhotoImage(self.image)
-        self.canvas.itemconfig(self.image_on_canvas, image=self.tk_image)
+        # display() already pushes into the photo, so only rebuild it for
+        # refreshes it has not seen
+        with self._lock:
+            stale = self._tk_generation != self._generation
+            if stale:
+                self.tk_image = self.ImageTk.PhotoImage(self._frame_image())
+                self._tk_generation = self._generation
+        if stale:
+            self.canvas.itemconfig(self.image_on_canvas, image=self.tk_image)
         self.root.update()
 
         self.root.after(
@@ -93,7 +392,7 @@ class EPD:
         )
 
     def init_flask(self):
-        from flask import Flask, render_template_string, send_file
+        from flask import Flask, jsonify, render_template_string, request, send_file
         self.app = Flask(__name__)
 
         @self.app.route('/')
@@ -112,28 +411,122 @@ class EPD:
                         }
                     </style>
                     <script>
+                        var generation = -1;
+
+                        function drawImage(url, x, y) {
+                            var image = new Image();
+                            image.onload = function() {
+                                var canvas = document.getElementById("screenImage");
+                                canvas.getContext("2d").drawImage(image, x, y);
+                            };
+                            image.src = url;
+                        }
+
+                        // Fetch only the windows changed since the last poll
                         function updateImage() {
-                            var image = document.getElementById("screenImage");
-                            image.src = "screen.png?t=" + new Date().getTime();
+                            fetch("updates?since=" + generation)
+                                .then(function(response) { return response.json(); })
+                                .then(function(update) {
+                                    var t = "t=" + update.generation;
+                                    if (update.full) {
+                                        drawImage("screen.png?" + t, 0, 0);
+                                    } else {
+                                        update.rects.forEach(function(r) {
+                                            drawImage("screen.png?box=" + r.join(",") + "&" + t, r[0], r[1]);
+                                        });
+                                    }
+                                    generation = update.generation;
+                                });
                         }
 
                         setInterval(updateImage, {{ update_ms }});
                     </script>
                 </head>
                 <body onload="updateImage()">
-                    <img id="screenImage" src="screen.png" alt="EPD Emulator">
+                    <canvas id="screenImage" width="{{ width }}" height="{{ height }}"></canvas>
                 </body>
                 </html>
-            ''', update_ms=int(self.update_interval * 1000))
+            ''', update_ms=int(self.update_interval * 1000), width=self.width, height=self.height)
+
+        def bad_request(error):
+            return jsonify(error=str(error)), 400
 
         @self.app.route('/screen.png')
         def display_image():
-            buf = self.image_bytes
+            box = request.args.get('box')
+            if box is None:
+                buf = self.image_bytes
+            else:
+                try:
+                    rect = self._check_window(*(int(v) for v in box.split(',')))
+                except (TypeError, ValueError) as e:
+                    return bad_request(e)
+                segment = self.segments.at_box(rect) if self.segments is not None else None
+                if segment is not None:
+                    self._sync_segments()
+                    buf = io.BytesIO(segment.png())
+                else:
+                    buf = io.BytesIO()
+                    with self._lock:
+                        window = self._frame_region(rect)
+                    window.save(buf, format='PNG')
             return send_file(
                 io.BytesIO(buf.getvalue()),
                 mimetype='image/png'
             )
 
+        @self.app.route('/updates')
+        def updates():
+            since = request.args.get('since', -1, type=int)
+            with self._lock:
+                generation = self._generation
+                pending = [rect for gen, rect in self._updates if gen > since]
+                # A page ahead of us was showing an earlier run of the emulator
+                missed = not self._updates or self._updates[0][0] > since + 1 or since > generation
+            if since == generation:
+                return jsonify(generation=generation, full=False, rects=[])
+            if missed or None in pending:
+                return jsonify(generation=generation, full=True)
+            if self.segments is not None:
+                whole = [segment for segment in map(self.segments.at_box, set(pending)) if segment is not None]
+                if whole:
+                    # Encode refreshed segments side by side before the page asks for them
+                    self._sync_segments()
+                    self.segments.encode(whole)
+            return jsonify(generation=generation, full=False, rects=pending)
+
+        @self.app.route('/display', methods=['POST'])
+        def ingest_buffer():
+            try:
+                self.load_buffer(request.get_data())
+            except ValueError as e:
+                return bad_request(e)
+            return '', 204
+
+        @self.app.route('/image', methods=['POST'])
+        def ingest_image():
+            try:
+                image = _decode_image(request.get_data())
+                box = (request.args.get('x', 0, type=int),
+                       request.args.get('y', 0, type=int))
+            except ValueError as e:
+                return bad_request(e)
+            self.paste_image(image, box)
+            return '', 204
+
+        @self.app.route('/draw', methods=['POST'])
+        def ingest_commands():
+            payload = request.get_json(silent=True)
+            if isinstance(payload, dict):
+                payload = payload.get('commands')
+            if not isinstance(payload, list):
+                return bad_request("Expected a JSON list of drawing commands")
+            try:
+                self.apply_commands(payload)
+            except ValueError as e:
+                return bad_request(e)
+            return '', 204
+
         threading.Thread(target=self.run_flask, daemon=True).start()
 
     def run_flask(self):
@@ -144,16 +537,34 @@ class EPD:
         timer.start()
         self.app.run(port=self.port, debug=False, use_reloader=False)
 
+    @property
+    def image_bytes(self):
+        """PNG of the current frame, encoded on first access after a refresh."""
+        if self._png_dirty:
+            self.update_image_bytes()
+        return self._image_bytes
+
+    @image_bytes.setter
+    def image_bytes(self, value):
+        self._image_bytes = value
+
     def update_image_bytes(self):
         buf = io.BytesIO()
         with self._lock:
-            self.image.save(buf, format='PNG')
+            self._png_dirty = False
+            self._frame_image().save(buf, format='PNG')
         self.image_bytes = buf
 
     def start_image_update_loop(self):
+        """Re-encode the full-frame PNG in the background whenever the frame changed.
+
+        Not started by default, since image_bytes encodes on demand and the
+        page fetches only changed windows after a partial refresh.
+        """
         def update_loop():
             while True:
-                self.update_image_bytes()
+                if self._png_dirty:
+                    self.update_image_bytes()
                 time.sleep(self.update_interval)
 
         threading.Thread(target=update_loop, daemon=True).start()
@@ -162,40 +573,272 @@ class EPD:
         print("EPD initialized")
 
     def Clear(self, color):
+        # Clear in place so existing draw objects stay bound to the frame
         with self._lock:
-            self.image = Image.new(
-                self.image_mode, (self.width, self.height), color
-            )
-            self.draw = ImageDraw.Draw(self.image)
-        self.display(self.getbuffer(self.image))
+            if self.framebuffer is not None:
+                self.framebuffer.clear(color)
+                self._image = None
+                self._draw = None
+            else:
+                self.image.paste(color, (0, 0, self.width, self.height))
+        self._refresh()
         print("Screen cleared")
 
     def display(self, image_buffer):  # image_buffer accepted for Waveshare API compatibility
-        if self.use_tkinter:
-            self.tk_image = self.ImageTk.PhotoImage(self.image)
-            self.canvas.itemconfig(
-                self.image_on_canvas, image=self.tk_image
+        with self._lock:
+            self._commit()
+            self._part_base = None
+            self._publish()
+            rects = self._track()
+        for rect in rects:
+            self._push(rect)
+
+    def _publish(self, rect=None):
+        """Send the committed frame to the recorder and shared export. Caller holds the lock.
+
+        With ``rect``, the shared export only receives the rows it covers.
+        """
+        if self.recorder is None and self.shared is None:
+            return
+        buffer = None
+        if self.recorder is not None:
+            buffer = self._current_buffer()
+            self.recorder.record(buffer)
+        if self.shared is not None:
+            if rect is None:
+                self.shared.publish(buffer or self._current_buffer())
+            else:
+                self.shared.publish_rows(rect, self._current_rows(rect[1], rect[3]))
+
+    def _check_window(self, x0, y0, x1, y1):
+        """Validate a partial refresh window (end exclusive) and return it as a tuple."""
+        if not (0 <= x0 < x1 <= self.width and 0 <= y0 < y1 <= self.height):
+            raise ValueError(
+                f"Window ({x0}, {y0}, {x1}, {y1}) is outside the "
+                f"{self.width}x{self.height} display"
             )
-            self.root.update()
+        return (x0, y0, x1, y1)
+
+    def _load_window(self, image_buffer, rect):
+        """Write a packed window buffer into the frame. Caller holds the lock."""
+        x0, y0, x1, y1 = rect
+        stride = row_stride(x1 - x0, self.image_mode)
+        x_byte = x0 * BITS_PER_PIXEL[self.image_mode] // 8
+        if self.framebuffer is not None:
+            self._commit()
+            blit_rows(self.framebuffer.data, self.framebuffer.stride, image_buffer, stride, x_byte, y0)
         else:
-            self.update_image_bytes()
+            self.image.paste(buffer_to_image(image_buffer, (x1 - x0, y1 - y0), self.image_mode), (x0, y0))
+        if self._part_base is not None:
+            blit_rows(self._part_base, row_stride(self.width, self.image_mode),
+                      image_buffer, stride, x_byte, y0)
+
+    def displayPartBaseImage(self, image_buffer):
+        """Show a full frame and make it the base for later displayPartial() calls."""
+        self.load_buffer(image_buffer)
+        with self._lock:
+            self._part_base = bytearray(image_buffer)
 
     def displayPartial(self, image_buffer):
-        self.display(image_buffer)
+        """Partial refresh with a full-frame buffer.
+
+        The frame is compared with the base image (the buffer from the
+        previous displayPartial() or displayPartBaseImage() call) and only
+        the region that changed is pushed to the viewer and shared export.
+        Without a base image the whole frame is refreshed.
+        """
+        self._check_buffer(image_buffer)
+        with self._lock:
+            base = self._part_base
+            self._load(image_buffer)
+            self._part_base = bytearray(image_buffer)
+            if base is None:
+                rect = (0, 0, self.width, self.height)
+            else:
+                rect = dirty_rect(base, image_buffer, self.width, self.height, self.image_mode)
+            rects = []
+            if rect is not None:
+                self._publish(rect)
+                rects = self._track(rect)
+        for rect in rects:
+            self._push(rect)
+
+    def display_Partial(self, image_buffer, x0, y0, x1, y1):
+        """Refresh only the window from ``(x0, y0)`` to ``(x1, y1)``, end exclusive.
+
+        ``image_buffer`` holds just the window's pixels in Waveshare layout,
+        e.g. ``getbuffer(image.crop((x0, y0, x1, y1)))``. On packed panels
+        the window's left and right edges must fall on byte boundaries
+        (multiples of 8 pixels for monochrome, 4 for 4-gray), or the right
+        edge may be the display's edge. Only the window is written, encoded
+        and pushed to the viewers.
+        """
+        rect = self._check_window(x0, y0, x1, y1)
+        per_byte = pixels_per_byte(self.image_mode)
+        if per_byte and (x0 % per_byte or (x1 % per_byte and x1 != self.width)):
+            raise ValueError(
+                f"Window x range {x0}..{x1} is not aligned to {per_byte}-pixel bytes"
+            )
+        expected = row_stride(x1 - x0, self.image_mode) * (y1 - y0)
+        if len(image_buffer) != expected:
+            raise ValueError(f"Window buffer has {len(image_buffer)} bytes, expected {expected}")
+        with self._lock:
+            self._load_window(image_buffer, rect)
+            self._publish(rect)
+            rects = self._track(rect)
+        for rect in rects:
+            self._push(rect)
+
+    def display_segment(self, name, image_buffer):
+        """Refresh one segment of a split panel.
+
+        ``image_buffer`` holds just that segment's pixels, like the buffer a
+        driver sends to one sub-panel's controller.
+        """
+        if self.segments is None:
+            raise ValueError(f"{self.config_name} is not a split panel")
+        self.display_Partial(image_buffer, *self.segments[name].box)
+
+    def get_segment_buffer(self, name):
+        """The buffer last displayed on one segment of a split panel."""
+        if self.segments is None:
+            raise ValueError(f"{self.config_name} is not a split panel")
+        segment = self.segments[name]
+        self._sync_segments()
+        return segment.buffer
+
+    def _track(self, rect=None):
+        """Windows to push after refreshing ``rect``. Caller holds the lock.
+
+        Split panels mark the segments the refresh touched as stale. The web
+        viewer is sent the part of the window inside each of them, or the
+        whole segment box when the refresh covers it, so it can be served
+        from the segment's PNG cache.
+        """
+        if self.segments is None:
+            return [rect]
+        touched = self.segments.mark(rect)
+        if self.headless or self.use_tkinter:
+            return [rect]
+        if rect is None:
+            return [segment.box for segment in touched]
+        return [segment.clip(rect) for segment in touched]
+
+    def _sync_segments(self):
+        """Extract and compare the segments changed since they were last read."""
+        with self._lock:
+            return self.segments.sync(self._current_window)
+
+    def _current_buffer(self):
+        """Buffer of the committed frame. Caller holds the lock."""
+        if self.framebuffer is not None:
+            return self.framebuffer.tobytes()
+        return self.getbuffer(self.image)
+
+    def _current_window(self, box):
+        """Buffer of a byte-aligned window of the committed frame. Caller holds the lock."""
+        if self.framebuffer is not None:
+            return window_bytes(self.framebuffer.data, self.framebuffer.stride, box, self.image_mode)
+        return self.getbuffer(self.image.crop(box))
+
+    def _current_rows(self, y0, y1):
+        """Buffer of full-width rows ``y0`` to ``y1`` of the committed frame. Caller holds the lock."""
+        if self.framebuffer is not None:
+            stride = self.framebuffer.stride
+            return bytes(self.framebuffer.data[y0 * stride:y1 * stride])
+        return self.getbuffer(self.image.crop((0, y0, self.width, y1)))
 
     def get_frame_buffer(self, draw):  # draw accepted for Waveshare API compatibility
+        if self.framebuffer is not None:
+            with self._lock:
+                self._commit()
+                return self.framebuffer.tobytes()
         return self.getbuffer(self.image)
 
+    def start_recording(self, path, keyframe_interval=100):
+        """Record every displayed frame to ``path`` until stop_recording().
+
+        See epaper_emulator.recording for the file format and replay tool.
+        """
+        from epaper_emulator.recording import FrameRecorder
+        self.stop_recording()
+        with self._lock:
+            self.recorder = FrameRecorder(
+                path, self.width, self.height, self.image_mode,
+                self.buffer_size(), model=self.config_name,
+                keyframe_interval=keyframe_interval,
+            )
+            self.recorder.record(self._current_buffer())
+        return self.recorder
+
+    def stop_recording(self):
+        with self._lock:
+            recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def buffer_size(self):
+        """Length in bytes of a full-frame buffer as returned by getbuffer()."""
+        return row_stride(self.width, self.image_mode) * self.height
+
+    def _check_buffer(self, image_buffer):
+        if len(image_buffer) != self.buffer_size():
+            raise ValueError(
+                f"Buffer has {len(image_buffer)} bytes, expected {self.buffer_size()}"
+            )
+
+    def _load(self, image_buffer):
+        """Replace the frame with a full-frame buffer. Caller holds the lock."""
+        if self.framebuffer is not None:
+            self.framebuffer.load_bytes(image_buffer)
+            self._image = None
+            self._draw = None
+        elif self.use_gray:
+            self.image.paste(unpack_gray(image_buffer, self.image.size))
+        else:
+            self.image.frombytes(bytes(image_buffer))
+
+    def load_buffer(self, image_buffer):
+        """Replace the frame with a Waveshare-format buffer and refresh.
+
+        This is the inverse of getbuffer(): packed bits for monochrome
+        panels, 2-bit codes in 4-gray mode, raw RGB bytes in color mode.
+        """
+        self._check_buffer(image_buffer)
+        with self._lock:
+            self._load(image_buffer)
+        self._refresh()
+
     def getbuffer(self, image):
+        if self.use_gray:
+            return self.getbuffer_4Gray(image)
         return image.tobytes()
 
+    def init_4Gray(self):
+        print("EPD initialized (4-gray)")
+
+    def getbuffer_4Gray(self, image):
+        """Pack ``image`` to 2 bits per pixel, snapping it to the four gray shades."""
+        return pack_gray(image.convert('L'))
+
+    def display_4Gray(self, image_buffer):
+        self.display(image_buffer)
+
     def sleep(self):
         print("EPD sleep")
 
     def Dev_exit(self):
         print("EPD exit")
-        if self.use_tkinter:
-            self.root.destroy()
+        try:
+            self.stop_recording()
+        finally:
+            if self.shared is not None:
+                self.shared.close()
+                self.shared = None
+            if self.segments is not None:
+                self.segments.close()
+            if self.use_tkinter and not self.headless:
+                self.root.destroy()
 
     def get_draw_object(self):
         return ImageDraw.Draw(self.image)
@@ -211,32 +854,107 @@ class EPD:
         """
         return _BatchContext(self)
 
-    def draw_text(self, position, text, font, fill):
+    def apply_commands(self, commands):
+        """Apply a list of JSON-style drawing commands as a single refresh.
+
+        Every command is validated before anything is drawn. The batch is
+        then drawn on a copy of the frame under the lock, and copied back
+        only if every command succeeds, so a failing batch leaves the frame
+        untouched and viewers never see a partial update. Supported ops:
+        ``clear``, ``text``, ``rectangle``, ``ellipse``, ``line`` and
+        ``image`` (base64-encoded, pasted at ``box``).
+        """
+        steps = [_parse_command(command) for command in commands]
         with self._lock:
+            target, draw = self.image, self._draw
+            self.image = target.copy()
+            try:
+                for step in steps:
+                    step(self)
+                # Paste back rather than swap, so held references to image and draw stay valid
+                target.paste(self.image)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Drawing failed: {e}") from e
+            finally:
+                self._image, self._draw = target, draw
+        if not self._batching:
+            self._refresh()
+
+    def _text_mask(self, text, font):
+        """Rendered text as a (mask, offset) pair, from the text cache when possible."""
+        # fontmode is '1' on monochrome images and 'L' (anti-aliased) otherwise
+        mode = self.draw.fontmode
+        key = (_font_key(font), text, mode)
+        entry = self.text_cache.get(key)
+        if entry is None:
+            left, top, right, bottom = self.draw.textbbox((0, 0), text, font=font)
+            mask = Image.new(mode, (max(right - left, 0), max(bottom - top, 0)), 0)
+            ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+            entry = (mask, (left, top))
+            self.text_cache.put(key, entry, mask.width * mask.height + len(text) + 64)
+        return entry
+
+    def _draw_text(self, position, text, font, fill):
+        """Draw text, pasting a cached bitmap when possible. Caller holds the lock."""
+        x, y = position
+        if (self.text_cache is None or fill is None
+                or not isinstance(x, int) or not isinstance(y, int)):
             self.draw.text(position, text, font=font, fill=fill)
+            return
+        mask, (left, top) = self._text_mask(text, font)
+        if mask.width and mask.height:
+            self.image.paste(fill, (x + left, y + top), mask)
+
+    def draw_text(self, position, text, font, fill):
+        """Draw text at ``position``.
+
+        Rendered strings are kept in ``text_cache`` (keyed by font, string
+        and image mode) and pasted as bitmaps on later calls, so redrawing
+        the same labels every frame skips rasterization. The fill color is
+        applied at paste time, so one entry serves every color. Instances
+        share one cache unless they were given a ``text_cache_size``.
+        """
+        with self._lock:
+            self._draw_text(position, text, font, fill)
         if not self._batching:
-            self.display(self.getbuffer(self.image))
+            self._refresh()
 
     def draw_rectangle(self, xy, outline=None, fill=None):
         with self._lock:
             self.draw.rectangle(xy, outline=outline, fill=fill)
         if not self._batching:
-            self.display(self.getbuffer(self.image))
+            self._refresh()
 
     def draw_line(self, xy, fill=None, width=0):
         with self._lock:
             self.draw.line(xy, fill=fill, width=width)
         if not self._batching:
-            self.display(self.getbuffer(self.image))
+            self._refresh()
 
     def draw_ellipse(self, xy, outline=None, fill=None):
         with self._lock:
             self.draw.ellipse(xy, outline=outline, fill=fill)
         if not self._batching:
-            self.display(self.getbuffer(self.image))
+            self._refresh()
+
+    def _convert_for_panel(self, image, method=None):
+        """Dither ``image`` to the colors this panel can show."""
+        if self.use_gray:
+            palette = tuple((level,) * 3 for level in GRAY_LEVELS)
+        else:
+            palette = self.palette if self.use_color else None
+        return _dither.convert(image, self.image_mode, palette, method or self.dither)
 
-    def paste_image(self, image, box=None, mask=None):
+    def paste_image(self, image, box=None, mask=None, dither=None):
+        """Paste ``image`` into the frame, converted to the panel's colors.
+
+        Monochrome panels get a black and white dither, and color models with
+        a ``palette`` in their config are reduced to those colors. ``dither``
+        overrides the instance's method (``'none'``, ``'ordered'`` or
+        ``'floyd-steinberg'``) for this call.
+        """
+        image = self._convert_for_panel(image, dither)
         with self._lock:
             self.image.paste(image, box, mask)
         if not self._batching:
-            self.display(self.getbuffer(self.image))
+            self._refresh()
@@ -0,0 +1,158 @@
+"""Compact framebuffer storage for the EPD emulator."""
+
+from PIL import Image, ImageChops
+
+# The four shades of 4-gray panels, darkest first. These are the Waveshare
+# GRAY4, GRAY3, GRAY2 and GRAY1 values, stored as 2-bit codes 0..3.
+GRAY_LEVELS = (0x00, 0x80, 0xC0, 0xFF)
+
+# 8-bit value -> 2-bit code of the nearest gray level
+_GRAY_INDEX = [0] * 64 + [1] * 96 + [2] * 64 + [3] * 32
+# 8-bit value -> nearest gray level
+GRAY_QUANTIZE = [GRAY_LEVELS[code] for code in _GRAY_INDEX]
+# Pillow's 'L;2' unpacker expands codes to 0, 85, 170 and 255
+_GRAY_UNPACK = [GRAY_LEVELS[min(value // 85, 3)] for value in range(256)]
+
+
+# Bits per pixel of the Waveshare buffer for each image mode
+BITS_PER_PIXEL = {'1': 1, 'L': 2, 'RGB': 24}
+
+
+def row_stride(width, mode):
+    """Bytes per row of a packed buffer, rows padded to whole bytes."""
+    return (width * BITS_PER_PIXEL[mode] + 7) // 8
+
+
+def dirty_rect(old, new, width, height, mode):
+    """Bounding box ``(x0, y0, x1, y1)`` of the pixels that differ between two buffers.
+
+    The buffers are compared as 'L' images one byte per pixel wide, so the
+    search runs inside Pillow. Returns None when the buffers are equal.
+    """
+    stride = row_stride(width, mode)
+    bbox = ImageChops.difference(
+        Image.frombytes('L', (stride, height), bytes(old)),
+        Image.frombytes('L', (stride, height), bytes(new)),
+    ).getbbox()
+    if bbox is None:
+        return None
+    bits = BITS_PER_PIXEL[mode]
+    x0, y0, x1, y1 = bbox
+    return (x0 * 8 // bits, y0, min(-(-x1 * 8 // bits), width), y1)
+
+
+def pixels_per_byte(mode):
+    """Pixels sharing one buffer byte, or 0 when pixels span whole bytes."""
+    return 8 // BITS_PER_PIXEL[mode]
+
+
+def blit_rows(dest, dest_stride, src, src_stride, x_byte, y0):
+    """Copy a packed window buffer into a packed frame at byte column ``x_byte``, row ``y0``."""
+    src = memoryview(src)
+    for row in range(len(src) // src_stride):
+        start = (y0 + row) * dest_stride + x_byte
+        dest[start:start + src_stride] = src[row * src_stride:(row + 1) * src_stride]
+
+
+def window_bytes(data, stride, box, mode):
+    """Waveshare buffer of the byte-aligned window ``box`` of a packed frame."""
+    bits = BITS_PER_PIXEL[mode]
+    x0, y0, x1, y1 = box
+    rows = Image.frombytes('L', (stride, y1 - y0), bytes(data[y0 * stride:y1 * stride]))
+    return rows.crop((x0 * bits // 8, 0, (x1 * bits + 7) // 8, y1 - y0)).tobytes()
+
+
+def pack_gray(image):
+    """Pack an 'L' image to 2 bits per pixel, four pixels per byte, MSB first.
+
+    Values are first snapped to the nearest of ``GRAY_LEVELS``. The layout
+    matches Waveshare's getbuffer_4Gray() for widths divisible by four.
+    """
+    codes = image.point(_GRAY_INDEX)
+    return Image.frombytes('P', image.size, codes.tobytes()).tobytes('raw', 'P;2')
+
+
+def unpack_gray(data, size):
+    """Inverse of pack_gray(): a 2-bit packed buffer to an 'L' image."""
+    return Image.frombytes('L', size, bytes(data), 'raw', 'L;2').point(_GRAY_UNPACK)
+
+
+def buffer_to_image(data, size, mode):
+    """Decode a Waveshare-format buffer of ``size`` pixels into a Pillow image."""
+    if mode == 'L':
+        return unpack_gray(data, size)
+    return Image.frombytes(mode, size, bytes(data))
+
+
+class PackedFramebuffer:
+    """Frame stored as packed bits instead of a Pillow image.
+
+    With ``bits=1`` pixels are packed eight to a byte (monochrome); with
+    ``bits=2`` four to a byte as 4-gray codes. Pixels run most significant
+    bits first and each row is padded to a whole byte. This is the buffer
+    layout the Waveshare drivers send to the panel, so ``data`` can be handed
+    out as the result of ``getbuffer()`` without any conversion. Pillow is
+    only involved when the frame has to be rasterized for drawing or viewing.
+    """
+
+    def __init__(self, width, height, fill=255, bits=1):
+        if bits not in (1, 2):
+            raise ValueError(f"Unsupported bits per pixel: {bits}")
+        self.width = width
+        self.height = height
+        self.bits = bits
+        self.mode = '1' if bits == 1 else 'L'
+        self.stride = (width * bits + 7) // 8
+        self.data = bytearray(self.stride * height)
+        self.clear(fill)
+
+    def __len__(self):
+        return len(self.data)
+
+    def _fill_code(self, fill):
+        """Resolve a Pillow fill value (int, color name, ...) to a pixel code."""
+        value = Image.new(self.mode, (1, 1), fill).getpixel((0, 0))
+        if self.bits == 1:
+            return 1 if value else 0
+        return _GRAY_INDEX[value]
+
+    def _row_pattern(self, code):
+        # Repeat the code across a byte: 1 -> 0xFF for 1 bit, 0x55 per step for 2 bits
+        byte = code * (0xFF if self.bits == 1 else 0x55)
+        # Padding bits stay zero, matching what Pillow's packers emit
+        tail = self.width * self.bits % 8
+        last = byte & (0xFF << (8 - tail)) & 0xFF if tail else byte
+        return bytes([byte]) * (self.stride - 1) + bytes([last])
+
+    def clear(self, fill):
+        """Fill the whole frame with ``fill`` without reallocating it."""
+        self.data[:] = self._row_pattern(self._fill_code(fill)) * self.height
+
+    def to_image(self):
+        """Rasterize the frame into a new Pillow image."""
+        size = (self.width, self.height)
+        if self.bits == 2:
+            return unpack_gray(self.data, size)
+        return Image.frombytes(self.mode, size, bytes(self.data))
+
+    def load_image(self, image):
+        """Pack a Pillow image of the same size back into the frame."""
+        if image.size != (self.width, self.height):
+            raise ValueError(
+                f"Image size {image.size} does not match framebuffer "
+                f"size {(self.width, self.height)}"
+            )
+        if image.mode != self.mode:
+            image = image.convert(self.mode)
+        self.data[:] = pack_gray(image) if self.bits == 2 else image.tobytes()
+
+    def load_bytes(self, buf):
+        """Replace the frame with a packed buffer in Waveshare layout."""
+        if len(buf) != len(self.data):
+            raise ValueError(
+                f"Buffer has {len(buf)} bytes, expected {len(self.data)}"
+            )
+        self.data[:] = buf
+
+    def tobytes(self):
+        return bytes(self.data)
@@ -0,0 +1,288 @@
+"""Record emulator sessions to disk and replay them.
+
+A recording is an append-only file of Waveshare-format frame buffers (the
+output of ``EPD.getbuffer()``):
+
+    header   magic, width, height, frame size, mode, model name
+    frames   length, timestamp, flags, zlib payload   (repeated)
+    index    offset, timestamp, flags                 (one per frame)
+    trailer  index offset, frame count, index magic
+
+Every ``keyframe_interval``-th frame stores the whole buffer. The others
+store it XORed with the previous frame, which is mostly zero bytes and
+compresses to almost nothing. The index is only written on close; readers
+rebuild it by scanning the frames if a session ended without one.
+
+Usage:
+    epaper-emulator replay session.epdrec --speed 4
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b'EPDREC01'
+INDEX_MAGIC = b'EPDRIDX1'
+KEYFRAME = 0x01
+
+_HEADER = struct.Struct('<8sIII4s32s')
+_FRAME = struct.Struct('<IdB')
+_INDEX_ENTRY = struct.Struct('<QdB')
+_TRAILER = struct.Struct('<QI8s')
+
+
+def _xor(a, b):
+    """Byte-wise XOR of two equal-length buffers, done as one big-int operation."""
+    value = int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')
+    return value.to_bytes(len(a), 'little')
+
+
+class FrameRecorder:
+    """Append frames to a recording file from a background writer thread.
+
+    record() only copies the buffer and queues it, so calling it from
+    display() does not slow down the emulator. Compression and disk I/O
+    happen on the writer thread. At most ``max_pending`` frames wait in the
+    queue; beyond that record() blocks until the writer catches up. If the
+    writer fails, the error is raised from the next record() or close().
+    close() flushes the queue and writes the index.
+    """
+
+    def __init__(self, path, width, height, mode, frame_size, model='',
+                 keyframe_interval=100, compression_level=1, max_pending=64):
+        self.path = path
+        self.frame_size = frame_size
+        self.keyframe_interval = keyframe_interval
+        self.compression_level = compression_level
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(
+            MAGIC, width, height, frame_size,
+            mode.encode('ascii'), model.encode('utf-8')[:32]
+        ))
+        self._index = []
+        self._previous = None
+        self._start = time.monotonic()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._index)
+
+    def record(self, buffer, timestamp=None):
+        """Queue one frame. ``timestamp`` defaults to seconds since recording started."""
+        if self._closed:
+            raise ValueError("Recording is closed")
+        if self._error is not None:
+            raise self._error
+        if len(buffer) != self.frame_size:
+            raise ValueError(
+                f"Frame has {len(buffer)} bytes, expected {self.frame_size}"
+            )
+        if timestamp is None:
+            timestamp = time.monotonic() - self._start
+        self._queue.put((timestamp, bytes(buffer)))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # Keep draining so record() never blocks on a dead writer
+            try:
+                self._write_frame(*item)
+            except Exception as e:
+                self._error = e
+
+    def _write_frame(self, timestamp, buffer):
+        if self._previous is None or len(self._index) % self.keyframe_interval == 0:
+            flags, payload = KEYFRAME, buffer
+        else:
+            flags, payload = 0, _xor(buffer, self._previous)
+        self._previous = buffer
+        payload = zlib.compress(payload, self.compression_level)
+        self._index.append((self._file.tell(), timestamp, flags))
+        self._file.write(_FRAME.pack(len(payload), timestamp, flags))
+        self._file.write(payload)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            self._file.close()
+            raise self._error
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(_INDEX_ENTRY.pack(*entry))
+        self._file.write(_TRAILER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+
+
+class FrameReader:
+    """Random access to the frames of a recording through a memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"{path} is not an EPD recording")
+        magic, self.width, self.height, self.frame_size, mode, model = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an EPD recording")
+        self.mode = mode.rstrip(b'\0').decode('ascii')
+        self.model = model.rstrip(b'\0').decode('utf-8')
+        self._index = self._read_index() or self._scan_frames()
+        self.timestamps = [timestamp for _, timestamp, _ in self._index]
+        self._cached = (None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.timestamps[i], self.frame(i)
+
+    def _read_index(self):
+        if len(self._map) < _HEADER.size + _TRAILER.size:
+            return None
+        index_offset, count, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != INDEX_MAGIC:
+            return None
+        return [
+            _INDEX_ENTRY.unpack_from(self._map, index_offset + i * _INDEX_ENTRY.size)
+            for i in range(count)
+        ]
+
+    def _scan_frames(self):
+        """Rebuild the index of a recording that was not closed cleanly."""
+        index = []
+        offset = _HEADER.size
+        end = len(self._map)
+        while offset + _FRAME.size <= end:
+            length, timestamp, flags = _FRAME.unpack_from(self._map, offset)
+            if offset + _FRAME.size + length > end:
+                break  # Truncated last frame
+            index.append((offset, timestamp, flags))
+            offset += _FRAME.size + length
+        return index
+
+    def _payload(self, i):
+        offset, _, flags = self._index[i]
+        length = _FRAME.unpack_from(self._map, offset)[0]
+        start = offset + _FRAME.size
+        return flags, zlib.decompress(self._map[start:start + length])
+
+    def frame(self, i):
+        """The full frame buffer at index ``i``."""
+        if not 0 <= i < len(self):
+            raise IndexError(f"Frame {i} out of range")
+        cached_i, cached = self._cached
+        if cached_i is not None and cached_i <= i and not any(
+                self._index[j][2] & KEYFRAME for j in range(cached_i + 1, i + 1)):
+            # Sequential access: apply deltas from the last decoded frame
+            start, buffer = cached_i + 1, cached
+        else:
+            start = i
+            while not self._index[start][2] & KEYFRAME:
+                start -= 1
+            buffer = None
+        for j in range(start, i + 1):
+            flags, payload = self._payload(j)
+            buffer = payload if flags & KEYFRAME else _xor(buffer, payload)
+        self._cached = (i, buffer)
+        return buffer
+
+    def index_at(self, timestamp):
+        """Index of the frame on screen at ``timestamp`` seconds."""
+        return max(bisect.bisect_right(self.timestamps, timestamp) - 1, 0)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def replay(path, epd, speed=1.0):
+    """Feed a recording back into ``epd`` through load_buffer() and display().
+
+    ``speed`` scales the original timing (2.0 plays twice as fast); ``None``
+    or ``0`` replays as fast as possible.
+    """
+    with FrameReader(path) as reader:
+        if reader.frame_size != epd.buffer_size():
+            raise ValueError(
+                f"Recording frames have {reader.frame_size} bytes, "
+                f"the display expects {epd.buffer_size()}"
+            )
+        start = time.monotonic()
+        for timestamp, buffer in reader:
+            if speed:
+                delay = timestamp / speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            epd.load_buffer(buffer)
+        return len(reader)
+
+
+def main(argv=None):
+    from epaper_emulator.emulator import EPD, currentdir
+
+    parser = argparse.ArgumentParser(description="Replay a recorded EPD emulator session.")
+    parser.add_argument('path', help="recording file")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="playback speed multiplier, 0 for as fast as possible")
+    parser.add_argument('--tkinter', action='store_true', help="use the Tkinter viewer")
+    parser.add_argument('--port', type=int, default=5000, help="Flask server port")
+    args = parser.parse_args(argv)
+
+    with FrameReader(args.path) as reader:
+        model, mode, width = reader.model, reader.mode, reader.width
+    with open(os.path.join(currentdir, 'config', f'{model}.json')) as f:
+        reverse_orientation = json.load(f).get('width') != width
+    epd = EPD(
+        config_file=model, use_tkinter=args.tkinter, port=args.port,
+        use_color=mode == 'RGB', use_gray=mode == 'L',
+        reverse_orientation=reverse_orientation,
+    )
+    count = replay(args.path, epd, args.speed)
+    print(f"Replayed {count} frames")
+    try:
+        if args.tkinter:
+            epd.root.mainloop()
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        epd.Dev_exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Split panels driven as several independent segments.
+
+Large panels such as the 12.48" ``epd12in48`` are built from sub-panels,
+each with its own controller and buffer. A model config lists them under
+``segments`` as ``name -> [x0, y0, x1, y1]`` boxes (end exclusive) in the
+panel's native orientation:
+
+    "segments": {"S2": [0, 0, 648, 492], "M2": [648, 0, 1304, 492], ...}
+
+Each segment keeps its own Waveshare-format buffer, generation counter and
+cached PNG. The buffers mirror the emulator's frame rather than replace it,
+which costs a second copy of the frame in memory. They are kept up to
+date lazily: a refresh only marks the segments it
+touched as stale, and stale segments are extracted and compared when
+something reads them (the web viewer or ``EPD.get_segment_buffer()``).
+Updating one segment then only extracts, compares and encodes that one.
+Work on several segments runs on a thread pool.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+
+from epaper_emulator.framebuffer import buffer_to_image, pixels_per_byte, row_stride
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class Segment:
+    """One sub-panel: its box in the full frame and its last buffer."""
+
+    def __init__(self, name, box, mode):
+        self.name = name
+        self.box = box
+        self.mode = mode
+        self.width = box[2] - box[0]
+        self.height = box[3] - box[1]
+        self.stride = row_stride(self.width, mode)
+        # (generation, buffer) replaced as one tuple so readers on other
+        # threads always see a matching pair
+        self._state = (0, bytes(self.stride * self.height))
+        self._png = (None, None)
+        self.stale = True
+
+    @property
+    def generation(self):
+        return self._state[0]
+
+    @property
+    def buffer(self):
+        return self._state[1]
+
+    def overlaps(self, rect):
+        return _overlaps(self.box, rect)
+
+    def clip(self, rect):
+        """The part of ``rect`` inside the segment, which is ``box`` when it covers the segment."""
+        return (max(rect[0], self.box[0]), max(rect[1], self.box[1]),
+                min(rect[2], self.box[2]), min(rect[3], self.box[3]))
+
+    def update(self, buffer):
+        """Store a new buffer. Returns False if it equals the current one."""
+        generation, current = self._state
+        if buffer == current:
+            return False
+        self._state = (generation + 1, bytes(buffer))
+        return True
+
+    def to_image(self):
+        return buffer_to_image(self.buffer, (self.width, self.height), self.mode)
+
+    def png(self):
+        """PNG of the segment, encoded once per generation."""
+        generation, buffer = self._state
+        cached_generation, data = self._png
+        if cached_generation != generation:
+            out = io.BytesIO()
+            buffer_to_image(buffer, (self.width, self.height), self.mode).save(out, format='PNG')
+            data = out.getvalue()
+            self._png = (generation, data)
+        return data
+
+
+class SegmentedPanel:
+    """The segments of one panel, updated and encoded in parallel."""
+
+    def __init__(self, boxes, width, height, mode):
+        per_byte = pixels_per_byte(mode)
+        self.segments = {}
+        for name, box in boxes.items():
+            box = tuple(box)
+            if len(box) != 4 or not (0 <= box[0] < box[2] <= width and 0 <= box[1] < box[3] <= height):
+                raise ValueError(f"Segment {name} box {box} is outside the {width}x{height} panel")
+            if per_byte and (box[0] % per_byte or (box[2] % per_byte and box[2] != width)):
+                raise ValueError(f"Segment {name} box {box} is not aligned to {per_byte}-pixel bytes")
+            for other in self.segments.values():
+                if other.overlaps(box):
+                    raise ValueError(f"Segments {other.name} and {name} overlap")
+            self.segments[name] = Segment(name, box, mode)
+        if not self.segments:
+            raise ValueError("A segmented panel needs at least one segment")
+        self._pool = None
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments.values())
+
+    def __getitem__(self, name):
+        try:
+            return self.segments[name]
+        except KeyError:
+            raise ValueError(
+                f"Unknown segment {name!r}, expected one of {', '.join(self.segments)}"
+            ) from None
+
+    def _map(self, function, segments):
+        if len(segments) <= 1:
+            return [function(segment) for segment in segments]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=len(self.segments), thread_name_prefix='epd-segment'
+            )
+        return list(self._pool.map(function, segments))
+
+    def mark(self, rect=None):
+        """Mark the segments overlapping ``rect`` (all by default) as stale and return them."""
+        touched = [segment for segment in self if rect is None or segment.overlaps(rect)]
+        for segment in touched:
+            segment.stale = True
+        return touched
+
+    def sync(self, extract):
+        """Bring stale segments up to date.
+
+        ``extract(box)`` returns the Waveshare buffer of a box of the frame.
+        Returns the segments whose buffer changed.
+        """
+        targets = [segment for segment in self if segment.stale]
+        for segment in targets:
+            segment.stale = False
+        changed = self._map(lambda segment: segment.update(extract(segment.box)), targets)
+        return [segment for segment, was_changed in zip(targets, changed) if was_changed]
+
+    def encode(self, segments=None):
+        """Encode the PNGs of ``segments`` (all by default) in parallel."""
+        segments = list(self) if segments is None else list(segments)
+        return self._map(Segment.png, segments) if segments else []
+
+    def at_box(self, box):
+        """The segment whose box is exactly ``box``, or None."""
+        box = tuple(box)
+        for segment in self:
+            if segment.box == box:
+                return segment
+        return None
+
+    def close(self):
+        """Stop the worker threads. They are started again when needed."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,164 @@
+"""Publish the live framebuffer in a memory-mapped file for other processes.
+
+The file holds a fixed 64-byte header followed by the current frame as a
+Waveshare-format buffer (the output of ``EPD.getbuffer()``):
+
+    offset  field       type
+         0  magic       8s       b'EPDSHM01'
+         8  width       u32
+        12  height      u32
+        16  mode        4s       '1', 'L' (2-bit 4-gray) or 'RGB'
+        20  stride      u32      bytes per row
+        24  frame_size  u32
+        28  (padding)   4 bytes
+        32  generation  u64      bumped to odd before and to even after each update
+        40  dirty rect  4 x u32  x0, y0, x1, y1 (exclusive) of the last update
+        64  frame       frame_size bytes
+
+All integers are little-endian. ``generation`` is 8-byte aligned so other
+languages can read it atomically. Readers check that the generation is even
+and unchanged around their read (a sequence lock) to get a consistent
+frame without any locking between processes. Point the path at a tmpfs
+such as /dev/shm to keep the file in memory.
+"""
+
+import mmap
+import struct
+import time
+
+from epaper_emulator.framebuffer import blit_rows, buffer_to_image, dirty_rect, row_stride
+
+MAGIC = b'EPDSHM01'
+HEADER_SIZE = 64
+
+_HEADER = struct.Struct('<8sII4sII4x')
+_GENERATION = struct.Struct('<Q')
+_RECT = struct.Struct('<IIII')
+_GENERATION_OFFSET = _HEADER.size
+_RECT_OFFSET = _GENERATION_OFFSET + _GENERATION.size
+
+
+class SharedFramebuffer:
+    """Writer side: owns the file and publishes frames into it."""
+
+    def __init__(self, path, width, height, mode):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.stride = row_stride(width, mode)
+        self.frame_size = self.stride * height
+        self.generation = 0
+        self._previous = None
+        with open(path, 'w+b') as f:
+            f.truncate(HEADER_SIZE + self.frame_size)
+            self._map = mmap.mmap(f.fileno(), 0)
+        _HEADER.pack_into(
+            self._map, 0, MAGIC, width, height,
+            mode.encode('ascii'), self.stride, self.frame_size
+        )
+
+    def publish(self, buffer, rect=None):
+        """Copy a frame into the shared file.
+
+        Only the rows inside the dirty rectangle are written. ``rect`` is
+        computed by comparing with the previous frame when not given.
+        Returns the rectangle, or None if nothing changed.
+        """
+        if len(buffer) != self.frame_size:
+            raise ValueError(
+                f"Frame has {len(buffer)} bytes, expected {self.frame_size}"
+            )
+        if self._previous is None:
+            rect = (0, 0, self.width, self.height)
+        elif rect is None:
+            rect = dirty_rect(self._previous, buffer, self.width, self.height, self.mode)
+            if rect is None:
+                return None
+        self.publish_rows(rect, memoryview(buffer)[rect[1] * self.stride:rect[3] * self.stride])
+        return rect
+
+    def publish_rows(self, rect, rows):
+        """Publish an update confined to ``rect``.
+
+        ``rows`` holds only the full-width rows ``rect[1]`` to ``rect[3]``,
+        so a partial refresh never has to produce a whole frame.
+        """
+        start = rect[1] * self.stride
+        if len(rows) != (rect[3] - rect[1]) * self.stride:
+            raise ValueError(
+                f"Rows have {len(rows)} bytes, expected {(rect[3] - rect[1]) * self.stride}"
+            )
+        if self._previous is None:
+            self._previous = bytearray(self.frame_size)
+        self.generation += 1
+        _GENERATION.pack_into(self._map, _GENERATION_OFFSET, self.generation)
+        self._map[HEADER_SIZE + start:HEADER_SIZE + start + len(rows)] = rows
+        _RECT.pack_into(self._map, _RECT_OFFSET, *rect)
+        self.generation += 1
+        _GENERATION.pack_into(self._map, _GENERATION_OFFSET, self.generation)
+        blit_rows(self._previous, self.stride, rows, self.stride, 0, rect[1])
+
+    def close(self):
+        self._map.close()
+
+
+class SharedFramebufferReader:
+    """Reader side, for use from another process.
+
+    ``data`` is a zero-copy view of the frame bytes in the mapping. Use
+    read() to get a consistent copy, or check ``generation`` before and
+    after using ``data`` directly.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.height, mode, self.stride, self.frame_size = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not an EPD shared framebuffer")
+        self.mode = mode.rstrip(b'\0').decode('ascii')
+        self.data = memoryview(self._map)[HEADER_SIZE:HEADER_SIZE + self.frame_size]
+
+    @property
+    def generation(self):
+        return _GENERATION.unpack_from(self._map, _GENERATION_OFFSET)[0]
+
+    @property
+    def dirty_rect(self):
+        return _RECT.unpack_from(self._map, _RECT_OFFSET)
+
+    def read(self):
+        """Consistent ``(generation, dirty_rect, frame_bytes)`` snapshot."""
+        while True:
+            before = self.generation
+            if before % 2 == 0:
+                rect = self.dirty_rect
+                frame = bytes(self.data)
+                if self.generation == before:
+                    return before, rect, frame
+            time.sleep(0)
+
+    def wait(self, generation, timeout=None, poll_interval=0.001):
+        """Block until the generation moves past ``generation``. Returns the new one, or None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.generation
+            if current != generation and current % 2 == 0:
+                return current
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def to_image(self, frame=None):
+        """Decode a frame (the current one by default) into a Pillow image."""
+        if frame is None:
+            frame = self.read()[2]
+        return buffer_to_image(frame, (self.width, self.height), self.mode)
+
+    def close(self):
+        self.data.release()
+        self._map.close()
@@ -0,0 +1,47 @@
+"""Tests for the memory-bounded LRU cache."""
+
+from epaper_emulator.cache import LRUCache
+
+
+class TestLRUCache:
+    def test_get_counts_hits_and_misses(self):
+        cache = LRUCache(100)
+        assert cache.get("a") is None
+        cache.put("a", 1, 10)
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(30)
+        cache.put("a", 1, 10)
+        cache.put("b", 2, 10)
+        cache.put("c", 3, 10)
+        cache.get("a")
+        cache.put("d", 4, 10)
+        assert "b" not in cache
+        assert "a" in cache
+        assert cache.current_bytes == 30
+        assert cache.evictions == 1
+
+    def test_replacing_key_updates_size(self):
+        cache = LRUCache(100)
+        cache.put("a", 1, 40)
+        cache.put("a", 2, 10)
+        assert cache.current_bytes == 10
+        assert cache.get("a") == 2
+
+    def test_oversized_value_not_stored(self):
+        cache = LRUCache(10)
+        cache.put("a", 1, 11)
+        assert len(cache) == 0
+        assert cache.current_bytes == 0
+
+    def test_clear(self):
+        cache = LRUCache(100)
+        cache.put("a", 1, 10)
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.current_bytes == 0
@@ -0,0 +1,85 @@
+"""Tests for the epaper-emulator command-line interface."""
+
+import json
+import os
+import sys
+import pytest
+from PIL import Image
+from epaper_emulator.cli import available_models, load_target, main
+
+
+def draw_frame(epd):
+    epd.draw_rectangle((0, 0, 9, 9), fill=0)
+
+
+def broken_frame(epd):
+    raise RuntimeError("boom")
+
+
+def test_available_models():
+    models = available_models()
+    assert "epd2in13" in models
+    assert len(models) == 21
+
+
+def test_load_target_from_script(tmp_path):
+    script = tmp_path / "screens.py"
+    script.write_text("def draw(epd):\n    return 'drawn'\n")
+    assert load_target(f"{script}:draw")(None) == "drawn"
+
+
+def test_load_target_from_working_directory(tmp_path, monkeypatch):
+    (tmp_path / "cwd_screens.py").write_text("def draw(epd):\n    return 'drawn'\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "path", [path for path in sys.path if path not in ("", str(tmp_path))])
+    monkeypatch.delitem(sys.modules, "cwd_screens", raising=False)
+    assert load_target("cwd_screens:draw")(None) == "drawn"
+    sys.modules.pop("cwd_screens", None)
+
+
+def test_load_target_rejects_missing_function_name():
+    with pytest.raises(ValueError):
+        load_target("tests.test_cli")
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_render_outputs(tmp_path, jobs):
+    out = str(tmp_path / "out")
+    code = main([
+        "render", "tests.test_cli:draw_frame", "--models", "epd2in13,epd2in7",
+        "--orientations", "all", "--modes", "mono,gray", "--formats", "all",
+        "--out", out, "--jobs", jobs,
+    ])
+    assert code == 0
+    with open(os.path.join(out, "stats.json")) as f:
+        stats = json.load(f)
+    # epd2in13 has no 4-gray mode, so its gray jobs are skipped
+    names = sorted(job["name"] for job in stats["jobs"])
+    assert len(names) == 6
+    assert "epd2in13_normal_gray" not in names
+    image = Image.open(os.path.join(out, "epd2in7_reversed_gray.png"))
+    assert image.size == (264, 176)
+    assert image.getpixel((5, 5)) == 0
+    assert os.path.getsize(os.path.join(out, "epd2in13_normal_mono.bin")) == 16 * 250
+
+
+def test_render_reports_failures(tmp_path):
+    out = str(tmp_path / "out")
+    code = main([
+        "render", "tests.test_cli:broken_frame", "--models", "epd2in13",
+        "--out", out, "--jobs", "1",
+    ])
+    assert code == 1
+    with open(os.path.join(out, "stats.json")) as f:
+        assert "boom" in json.load(f)["jobs"][0]["error"]
+
+
+@pytest.mark.parametrize("jobs", ["0", "-2", "many"])
+def test_render_rejects_bad_jobs(tmp_path, jobs):
+    with pytest.raises(SystemExit):
+        main(["render", "tests.test_cli:draw_frame", "--jobs", jobs, "--out", str(tmp_path)])
+
+
+def test_render_rejects_unknown_model(tmp_path):
+    with pytest.raises(SystemExit):
+        main(["render", "tests.test_cli:draw_frame", "--models", "epd0in0", "--out", str(tmp_path)])
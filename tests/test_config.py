@@ -4,6 +4,8 @@ import json
 import os
 import glob
 import pytest
+from PIL import ImageColor
+from epaper_emulator.segments import SegmentedPanel
 
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "epaper_emulator", "config")
 REQUIRED_KEYS = {"name", "width", "height", "color", "text_color"}
@@ -48,3 +50,23 @@ def test_config_name_matches_filename(config_path, config_data):
     assert config_data["name"] == expected_name, (
         f"Config name '{config_data['name']}' doesn't match filename '{expected_name}'"
     )
+
+
+def test_config_palette_is_valid(config_data):
+    palette = config_data.get("palette", [])
+    assert not palette or len(palette) >= 2, "palette needs at least two colors"
+    for color in palette:
+        ImageColor.getrgb(color)
+
+
+def test_config_gray_levels(config_data):
+    assert config_data.get("gray_levels", 2) in (2, 4)
+
+
+def test_config_segments_tile_the_panel(config_data):
+    segments = config_data.get("segments")
+    if not segments:
+        return
+    panel = SegmentedPanel(segments, config_data["width"], config_data["height"], "1")
+    assert sum(segment.width * segment.height for segment in panel) == \
+        config_data["width"] * config_data["height"]
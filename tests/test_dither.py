@@ -0,0 +1,78 @@
+"""Tests for the paste_image conversion pipeline."""
+
+import pytest
+from PIL import Image
+from epaper_emulator import dither
+
+ACEP = dither.parse_palette(
+    ["#000000", "#ffffff", "#00ff00", "#0000ff", "#ff0000", "#ffff00", "#ff8000"]
+)
+
+
+def gradient(size=(64, 48)):
+    gray = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGB", (gray, gray.rotate(90), gray.rotate(180)))
+
+
+def colors_of(image):
+    return {color for _, color in image.getcolors(image.width * image.height)}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    dither.clear_cache()
+    yield
+    dither.clear_cache()
+
+
+@pytest.mark.parametrize("method", dither.METHODS)
+def test_monochrome_output(method):
+    result = dither.convert(gradient(), "1", method=method)
+    assert result.mode == "1"
+    assert result.size == (64, 48)
+    assert colors_of(result) == {0, 255}
+
+
+@pytest.mark.parametrize("method", dither.METHODS)
+def test_palette_output_uses_only_palette_colors(method):
+    result = dither.convert(gradient(), "RGB", ACEP, method)
+    assert result.mode == "RGB"
+    assert colors_of(result) <= set(ACEP)
+
+
+def test_floyd_steinberg_matches_pillow():
+    image = gradient()
+    assert dither.convert(image, "1").tobytes() == image.convert("1").tobytes()
+
+
+def test_ordered_dither_keeps_mid_gray_balanced():
+    result = dither.convert(Image.new("L", (64, 64), 128), "1", method=dither.ORDERED)
+    white = result.convert("L").histogram()[255]
+    assert white == 64 * 64 // 2
+
+
+def test_rgb_without_palette_is_passed_through():
+    image = gradient()
+    assert dither.convert(image, "RGB") is image
+
+
+def test_results_are_cached():
+    image = gradient()
+    first = dither.convert(image, "RGB", ACEP)
+    second = dither.convert(image.copy(), "RGB", ACEP)
+    assert first is second
+    assert dither.cache_stats()["hits"] == 1
+
+
+def test_palette_images_with_same_indices_are_not_confused():
+    black = Image.new("P", (8, 8), 0)
+    black.putpalette([0, 0, 0])
+    white = Image.new("P", (8, 8), 0)
+    white.putpalette([255, 255, 255])
+    assert dither.convert(black, "1").getpixel((0, 0)) == 0
+    assert dither.convert(white, "1").getpixel((0, 0)) == 255
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        dither.convert(gradient(), "1", method="atkinson")
@@ -1,6 +1,9 @@
 """Tests for the EPD emulator class."""
 
-from unittest.mock import patch
+import base64
+import io
+from unittest.mock import MagicMock, patch
+import pytest
 from PIL import Image, ImageFont
 from epaper_emulator.emulator import EPD
 
@@ -15,6 +18,13 @@ def make_epd(**kwargs):
         return EPD(**defaults)
 
 
+def make_client(epd):
+    """Set up the Flask routes and a test client without starting the server."""
+    with patch.object(EPD, "run_flask"):
+        epd.init_flask()
+    return epd.app.test_client()
+
+
 class TestEPDInit:
     def test_default_dimensions(self):
         epd = make_epd()
@@ -97,6 +107,55 @@ class TestDrawingMethods:
         assert before != after
 
 
+class TestTextCache:
+    def test_cached_text_matches_direct_rendering(self):
+        font = ImageFont.load_default()
+        for use_color in (False, True):
+            cached = make_epd(use_color=use_color)
+            direct = make_epd(use_color=use_color, text_cache_size=0)
+            for epd in (cached, direct):
+                for _ in range(2):
+                    epd.draw_text((10, 10), "12:34\nHello", font=font, fill=0)
+                epd.draw_text((-3, 240), "Clipped", font=font, fill=0)
+            assert cached.image.tobytes() == direct.image.tobytes()
+
+    def test_repeated_text_hits_cache(self):
+        epd = make_epd(text_cache_size=1 << 20)
+        font = ImageFont.load_default()
+        epd.draw_text((10, 10), "Hello", font=font, fill=0)
+        epd.draw_text((10, 40), "Hello", font=font, fill=0)
+        stats = epd.text_cache.stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+
+    def test_fill_does_not_split_cache(self):
+        epd = make_epd(use_color=True, text_cache_size=1 << 20)
+        font = ImageFont.load_default()
+        epd.draw_text((10, 10), "Hello", font=font, fill="red")
+        epd.draw_text((10, 40), "Hello", font=font, fill="black")
+        assert len(epd.text_cache) == 1
+
+    def test_instances_share_cache_by_default(self):
+        assert make_epd().text_cache is make_epd().text_cache
+        assert make_epd(text_cache_size=1024).text_cache is not make_epd().text_cache
+
+    def test_draw_commands_reuse_default_font(self):
+        epd = make_epd(text_cache_size=1 << 20)
+        for _ in range(3):
+            epd.apply_commands([{"op": "text", "xy": [0, 0], "text": "Hi", "size": 13, "fill": 0}])
+        stats = epd.text_cache.stats()
+        assert (stats["misses"], stats["hits"]) == (1, 2)
+        # Keyed by size, so cache entries don't hold on to the font object
+        assert all(isinstance(key[0], tuple) for key in epd.text_cache._entries)
+
+    def test_cache_can_be_disabled(self):
+        epd = make_epd(text_cache_size=0)
+        assert epd.text_cache is None
+        before = epd.image.tobytes()
+        epd.draw_text((10, 10), "Hello", font=ImageFont.load_default(), fill=0)
+        assert epd.image.tobytes() != before
+
+
 class TestPasteImage:
     def test_paste_image(self):
         epd = make_epd()
@@ -113,6 +172,90 @@ class TestPasteImage:
         assert epd.image.getpixel((10, 10)) == 0
 
 
+class TestPasteImageDithering:
+    def test_palette_loaded_from_config(self):
+        epd = make_epd(config_file="epd5in65", use_color=True)
+        assert len(epd.palette) == 7
+        assert make_epd().palette is None
+
+    def test_color_paste_mapped_to_palette(self):
+        epd = make_epd(config_file="epd5in65", use_color=True)
+        photo = Image.new("RGB", (40, 40), (200, 60, 40))
+        epd.paste_image(photo, box=(0, 0))
+        colors = {color for _, color in epd.image.crop((0, 0, 40, 40)).getcolors()}
+        assert colors <= set(epd.palette)
+
+    def test_color_paste_without_palette_unchanged(self):
+        epd = make_epd(use_color=True)
+        epd.paste_image(Image.new("RGB", (10, 10), (12, 34, 56)), box=(0, 0))
+        assert epd.image.getpixel((5, 5)) == (12, 34, 56)
+
+    def test_per_call_method(self):
+        epd = make_epd()
+        epd.paste_image(Image.new("L", (10, 10), 100), box=(0, 0), dither="none")
+        assert epd.image.getpixel((5, 5)) == 0
+
+    def test_unknown_method_rejected(self):
+        with pytest.raises(ValueError):
+            make_epd(dither="bogus")
+
+
+class TestGrayMode:
+    def test_gray_image_mode(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True)
+        assert epd.image_mode == "L"
+        assert epd.buffer_size() == 176 // 4 * 264
+
+    def test_model_without_gray_support(self):
+        with pytest.raises(ValueError):
+            make_epd(config_file="epd2in13", use_gray=True)
+
+    def test_gray_and_color_exclusive(self):
+        with pytest.raises(ValueError):
+            make_epd(config_file="epd2in7", use_gray=True, use_color=True)
+
+    def test_drawing_snaps_to_gray_levels(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True)
+        epd.draw_rectangle((0, 0, 20, 20), fill=100)
+        assert epd.image.getpixel((10, 10)) == EPD.GRAY3
+
+    def test_getbuffer_4gray(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True)
+        epd.Clear(EPD.GRAY2)
+        buf = epd.getbuffer_4Gray(epd.image)
+        assert buf == bytes([0b10101010]) * epd.buffer_size()
+        assert epd.getbuffer(epd.image) == buf
+
+    def test_load_buffer_round_trip(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True)
+        epd.draw_rectangle((0, 0, 40, 40), fill=EPD.GRAY3)
+        buf = epd.get_frame_buffer(None)
+        other = make_epd(config_file="epd2in7", use_gray=True)
+        other.load_buffer(buf)
+        assert other.image.tobytes() == epd.image.tobytes()
+
+    def test_compact_gray_matches_full(self):
+        compact = make_epd(config_file="epd2in7", use_gray=True, compact=True)
+        full = make_epd(config_file="epd2in7", use_gray=True)
+        for epd in (compact, full):
+            epd.draw_ellipse((10, 10, 80, 60), fill=EPD.GRAY2)
+            epd.draw_text((5, 100), "Gray", font=ImageFont.load_default(), fill=0)
+        assert len(compact.framebuffer) * 4 == compact.width * compact.height
+        assert compact.get_frame_buffer(None) == full.get_frame_buffer(None)
+
+    def test_paste_image_uses_four_shades(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True)
+        epd.paste_image(Image.linear_gradient("L").resize((64, 64)), box=(0, 0))
+        shades = {value for _, value in epd.image.getcolors()}
+        assert shades <= set((EPD.GRAY1, EPD.GRAY2, EPD.GRAY3, EPD.GRAY4))
+        assert len(shades) == 4
+
+    def test_png_render(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True, compact=True)
+        epd.update_image_bytes()
+        assert epd.image_bytes.getvalue()[:4] == b'\x89PNG'
+
+
 class TestUpdateImageBytes:
     def test_produces_valid_png(self):
         epd = make_epd()
@@ -151,3 +294,386 @@ class TestFlaskRoutes:
         assert response.status_code == 200
         assert response.content_type == 'image/png'
         assert response.data[:4] == b'\x89PNG'
+
+
+class TestCompactMode:
+    def test_compact_requires_monochrome(self):
+        with pytest.raises(ValueError):
+            make_epd(use_color=True, compact=True)
+
+    def test_no_image_until_drawing(self):
+        epd = make_epd(compact=True)
+        assert epd._image is None
+        assert len(epd.framebuffer.data) == (epd.width + 7) // 8 * epd.height
+
+    def test_drawing_is_packed_on_display(self):
+        epd = make_epd(compact=True)
+        epd.draw_rectangle((0, 0, 50, 50), outline=0, fill=0)
+        # display() packs the drawing and releases the image
+        assert epd._image is None
+        assert epd.image.getpixel((25, 25)) == 0
+        assert epd.image.getpixel((100, 100)) == 255
+
+    def test_buffer_matches_full_image_mode(self):
+        compact = make_epd(compact=True)
+        full = make_epd()
+        for epd in (compact, full):
+            epd.draw_ellipse((10, 10, 80, 60), outline=0, fill=0)
+        assert compact.get_frame_buffer(None) == full.get_frame_buffer(None)
+
+    def test_clear_in_place(self):
+        epd = make_epd(compact=True)
+        data = epd.framebuffer.data
+        epd.Clear(0)
+        assert epd.framebuffer.data is data
+        assert epd.image.getcolors() == [(epd.width * epd.height, 0)]
+
+    def test_produces_valid_png(self):
+        epd = make_epd(compact=True)
+        epd.update_image_bytes()
+        assert epd.image_bytes.getvalue()[:4] == b'\x89PNG'
+        assert epd._image is None
+
+
+class TestClearInPlace:
+    def test_clear_keeps_draw_object(self):
+        epd = make_epd()
+        draw = epd.draw
+        epd.Clear(0)
+        draw.rectangle((0, 0, 10, 10), fill=255)
+        assert epd.image.getpixel((5, 5)) == 255
+
+
+class TestIngestRoutes:
+    def make_client(self, **kwargs):
+        epd = make_epd(**kwargs)
+        epd.update_image_bytes()
+        return epd, make_client(epd)
+
+    def test_post_display_buffer(self):
+        epd, client = self.make_client()
+        response = client.post('/display', data=bytes(epd.buffer_size()))
+        assert response.status_code == 204
+        assert epd.image.getcolors() == [(epd.width * epd.height, 0)]
+
+    def test_post_display_buffer_compact(self):
+        epd, client = self.make_client(compact=True)
+        response = client.post('/display', data=bytes(epd.buffer_size()))
+        assert response.status_code == 204
+        assert epd.framebuffer.tobytes() == bytes(epd.buffer_size())
+
+    def test_post_display_rejects_wrong_length(self):
+        epd, client = self.make_client()
+        response = client.post('/display', data=b'\x00' * 3)
+        assert response.status_code == 400
+        assert 'expected' in response.get_json()['error']
+
+    def test_post_image(self):
+        epd, client = self.make_client()
+        encoded = io.BytesIO()
+        Image.new("1", (20, 20), 0).save(encoded, format='PNG')
+        response = client.post('/image?x=5&y=5', data=encoded.getvalue())
+        assert response.status_code == 204
+        assert epd.image.getpixel((10, 10)) == 0
+        assert epd.image.getpixel((2, 2)) == 255
+
+    def test_post_image_rejects_garbage(self):
+        epd, client = self.make_client()
+        response = client.post('/image', data=b'not an image')
+        assert response.status_code == 400
+
+    def test_post_draw_commands(self):
+        epd, client = self.make_client(use_color=True)
+        encoded = io.BytesIO()
+        Image.new("RGB", (10, 10), (0, 0, 255)).save(encoded, format='PNG')
+        response = client.post('/draw', json={"commands": [
+            {"op": "clear", "fill": "white"},
+            {"op": "rectangle", "xy": [[0, 0], [20, 20]], "fill": [255, 0, 0]},
+            {"op": "line", "xy": [0, 40, 50, 40], "fill": "black", "width": 1},
+            {"op": "text", "xy": [5, 60], "text": "Hi", "fill": "black"},
+            {"op": "image", "data": base64.b64encode(encoded.getvalue()).decode(), "box": [40, 80]},
+            {"op": "image", "data": base64.b64encode(encoded.getvalue()).decode(), "box": [80, 80]},
+        ]})
+        assert response.status_code == 204
+        assert epd.image.getpixel((10, 10)) == (255, 0, 0)
+        assert epd.image.getpixel((25, 40)) == (0, 0, 0)
+        assert epd.image.getpixel((45, 85)) == (0, 0, 255)
+        assert epd.image.getpixel((85, 85)) == (0, 0, 255)
+
+    def test_post_draw_is_all_or_nothing(self):
+        epd, client = self.make_client()
+        before = epd.image.tobytes()
+        response = client.post('/draw', json=[
+            {"op": "rectangle", "xy": [0, 0, 50, 50], "fill": 0},
+            {"op": "bogus"},
+        ])
+        assert response.status_code == 400
+        assert epd.image.tobytes() == before
+
+    @pytest.mark.parametrize("command", [
+        {"op": "rectangle", "xy": [50, 50, 0, 0], "fill": 0},
+        {"op": "rectangle", "xy": [0, 0, 5], "fill": 0},
+        {"op": "rectangle", "xy": [60, 60, 70, 70], "fill": "notacolor"},
+        {"op": "line", "xy": [0, 0, 10, 10], "width": [1]},
+        {"op": "line", "xy": [0, 0], "fill": 0},
+        {"op": "text", "xy": [0, 0, 1], "text": "x"},
+        {"op": "text", "xy": [0, 0], "text": "x", "size": [1]},
+        {"op": "text", "xy": [0, 0], "text": "x", "size": "abc"},
+        {"op": "text", "xy": [0, 0], "text": "x", "size": 0},
+        {"op": "text", "xy": [0, 0], "text": "x", "size": True},
+    ])
+    def test_post_draw_rejects_invalid_arguments(self, command):
+        epd, client = self.make_client()
+        before = epd.image.tobytes()
+        response = client.post('/draw', json=[{"op": "rectangle", "xy": [0, 0, 50, 50], "fill": 0}, command])
+        assert response.status_code == 400
+        assert epd.image.tobytes() == before
+
+    def test_post_draw_rejects_image_box_size(self):
+        epd, client = self.make_client()
+        buf = io.BytesIO()
+        Image.new("1", (8, 8), 0).save(buf, format="PNG")
+        response = client.post('/draw', json=[{
+            "op": "image", "data": base64.b64encode(buf.getvalue()).decode(), "box": [0, 0, 16, 16],
+        }])
+        assert response.status_code == 400
+
+    def test_post_draw_rolls_back_when_drawing_fails(self):
+        epd, client = self.make_client()
+        before = epd.image.tobytes()
+        # A valid color for JSON, but Pillow cannot draw RGB on a monochrome frame
+        response = client.post('/draw', json=[
+            {"op": "rectangle", "xy": [0, 0, 50, 50], "fill": 0},
+            {"op": "rectangle", "xy": [60, 60, 70, 70], "fill": [255, 0, 0]},
+        ])
+        assert response.status_code == 400
+        assert epd.image.tobytes() == before
+
+    def test_apply_commands_keeps_draw_reference(self):
+        epd = make_epd()
+        draw = epd.draw
+        epd.apply_commands([{"op": "rectangle", "xy": [0, 0, 10, 10], "fill": 0}])
+        draw.rectangle((20, 20, 30, 30), fill=0)
+        assert epd.image.getpixel((5, 5)) == 0
+        assert epd.image.getpixel((25, 25)) == 0
+
+    def test_post_draw_refreshes_once(self):
+        epd, client = self.make_client()
+        with patch.object(epd, "display") as display:
+            client.post('/draw', json=[
+                {"op": "rectangle", "xy": [0, 0, 10, 10], "fill": 0},
+                {"op": "ellipse", "xy": [20, 20, 30, 30], "fill": 0},
+            ])
+        assert display.call_count == 1
+
+
+class TestHeadless:
+    def test_headless_starts_no_viewer(self):
+        with patch.object(EPD, "init_tkinter") as tk, \
+             patch.object(EPD, "init_flask") as flask:
+            epd = EPD(headless=True)
+        tk.assert_not_called()
+        flask.assert_not_called()
+        epd.draw_rectangle((0, 0, 10, 10), fill=0)
+        assert epd.image.getpixel((5, 5)) == 0
+        assert epd._image_bytes is None
+
+
+class TestPartialRefresh:
+    def window(self, epd, rect, fill=0):
+        image = Image.new(epd.image_mode, (rect[2] - rect[0], rect[3] - rect[1]), fill)
+        return epd.getbuffer(image)
+
+    @pytest.mark.parametrize("kwargs", [{}, {"compact": True}, {"config_file": "epd2in7", "use_gray": True},
+                                        {"use_color": True}])
+    def test_display_partial_writes_only_window(self, kwargs):
+        epd = make_epd(**kwargs)
+        epd.display_Partial(self.window(epd, (8, 10, 24, 20)), 8, 10, 24, 20)
+        image = epd.image.convert('L')
+        assert image.getpixel((8, 10)) == 0
+        assert image.getpixel((23, 19)) == 0
+        assert image.getpixel((24, 19)) == 255
+        assert image.getpixel((8, 20)) == 255
+        assert image.getbbox() is not None
+        assert Image.eval(image, lambda v: 255 - v).getbbox() == (8, 10, 24, 20)
+
+    def test_window_may_end_at_display_edge(self):
+        epd = make_epd()
+        epd.display_Partial(self.window(epd, (112, 0, 122, 5)), 112, 0, 122, 5)
+        assert epd.image.getpixel((121, 4)) == 0
+
+    @pytest.mark.parametrize("rect", [(4, 0, 16, 8), (0, 0, 12, 8), (0, 0, 0, 8), (0, 0, 8, 251)])
+    def test_rejects_bad_windows(self, rect):
+        epd = make_epd()
+        with pytest.raises(ValueError):
+            epd.display_Partial(b'', *rect)
+
+    def test_gray_windows_align_to_four_pixels(self):
+        epd = make_epd(config_file="epd2in7", use_gray=True)
+        epd.display_Partial(self.window(epd, (4, 0, 12, 4)), 4, 0, 12, 4)
+        with pytest.raises(ValueError):
+            epd.display_Partial(self.window(epd, (2, 0, 10, 4)), 2, 0, 10, 4)
+
+    def test_rejects_wrong_buffer_length(self):
+        epd = make_epd()
+        with pytest.raises(ValueError):
+            epd.display_Partial(bytes(3), 0, 0, 8, 4)
+
+    def test_pushes_only_window(self):
+        epd = make_epd(compact=True)
+        with patch.object(EPD, "update_image_bytes") as encode, \
+             patch.object(EPD, "_current_buffer") as full_buffer:
+            epd.display_Partial(self.window(epd, (0, 0, 16, 16)), 0, 0, 16, 16)
+        encode.assert_not_called()
+        full_buffer.assert_not_called()
+        assert epd._image is None
+        assert list(epd._updates)[-1] == (epd._generation, (0, 0, 16, 16))
+
+    def test_shared_export_gets_window(self, tmp_path):
+        from epaper_emulator.sharedmem import SharedFramebufferReader
+        path = str(tmp_path / "fb")
+        epd = make_epd(shared_framebuffer=path)
+        epd.display_Partial(self.window(epd, (8, 30, 16, 40)), 8, 30, 16, 40)
+        reader = SharedFramebufferReader(path)
+        try:
+            assert reader.dirty_rect == (8, 30, 16, 40)
+            assert reader.read()[2] == epd.getbuffer(epd.image)
+        finally:
+            reader.close()
+        epd.Dev_exit()
+
+    def test_display_partial_diffs_against_base(self):
+        epd = make_epd()
+        epd.displayPartBaseImage(epd.getbuffer(epd.image))
+        epd.draw.rectangle((10, 50, 19, 59), fill=0)
+        with patch.object(EPD, "_push") as push:
+            epd.displayPartial(epd.getbuffer(epd.image))
+        push.assert_called_once_with((8, 50, 24, 60))
+
+    def test_display_partial_skips_unchanged_frame(self):
+        epd = make_epd()
+        epd.displayPartBaseImage(epd.getbuffer(epd.image))
+        with patch.object(EPD, "_push") as push:
+            epd.displayPartial(epd.getbuffer(epd.image))
+        push.assert_not_called()
+
+    def test_display_partial_without_base_refreshes_all(self):
+        epd = make_epd()
+        with patch.object(EPD, "_push") as push:
+            epd.displayPartial(epd.getbuffer(epd.image))
+        push.assert_called_once_with((0, 0, epd.width, epd.height))
+
+    def test_window_updates_base(self):
+        epd = make_epd()
+        epd.displayPartBaseImage(epd.getbuffer(epd.image))
+        epd.display_Partial(self.window(epd, (0, 0, 8, 8)), 0, 0, 8, 8)
+        with patch.object(EPD, "_push") as push:
+            epd.displayPartial(epd.getbuffer(epd.image))
+        push.assert_not_called()
+
+    def test_full_display_drops_base(self):
+        epd = make_epd()
+        epd.displayPartBaseImage(epd.getbuffer(epd.image))
+        epd.display(None)
+        assert epd._part_base is None
+
+
+class TestTkinterUpdates:
+    def make_tk_epd(self):
+        epd = make_epd(use_tkinter=True)
+        epd.ImageTk, epd.root, epd.canvas = MagicMock(), MagicMock(), MagicMock()
+        epd.tk_image, epd.image_on_canvas = MagicMock(), 1
+        return epd
+
+    def test_periodic_update_skips_unchanged_frame(self):
+        epd = self.make_tk_epd()
+        epd.update_tkinter()
+        epd.display_Partial(bytes(8), 0, 0, 8, 8)
+        epd.ImageTk.PhotoImage.reset_mock()
+        epd.update_tkinter()
+        epd.ImageTk.PhotoImage.assert_not_called()
+        epd.canvas.itemconfig.assert_not_called()
+
+    def test_window_is_copied_into_photo(self):
+        epd = self.make_tk_epd()
+        epd.display_Partial(bytes(8), 8, 0, 16, 8)
+        assert epd.ImageTk.PhotoImage.call_args.args[0].size == (8, 8)
+        window = str(epd.ImageTk.PhotoImage.return_value)
+        assert epd.root.tk.call.call_args.args[1:] == ('copy', window, '-to', 8, 0)
+
+    def test_periodic_update_rebuilds_after_missed_refresh(self):
+        epd = self.make_tk_epd()
+        epd._generation += 1
+        epd.update_tkinter()
+        epd.ImageTk.PhotoImage.assert_called_once()
+        epd.canvas.itemconfig.assert_called_once()
+
+
+class TestPartialRefreshRoutes:
+    def make_client(self):
+        epd = make_epd()
+        return epd, make_client(epd)
+
+    def test_updates_lists_windows(self):
+        epd, client = self.make_client()
+        epd.display(None)
+        generation = client.get('/updates?since=-1').get_json()['generation']
+        epd.display_Partial(bytes(8), 0, 0, 8, 8)
+        epd.display_Partial(bytes(8), 8, 8, 16, 16)
+        update = client.get(f'/updates?since={generation}').get_json()
+        assert update == {'generation': generation + 2, 'full': False,
+                          'rects': [[0, 0, 8, 8], [8, 8, 16, 16]]}
+
+    def test_updates_requests_full_frame(self):
+        epd, client = self.make_client()
+        epd.display_Partial(bytes(8), 0, 0, 8, 8)
+        epd.display(None)
+        assert client.get('/updates?since=1').get_json()['full'] is True
+        assert client.get('/updates?since=-1').get_json()['full'] is True
+
+    def test_updates_after_restart_requests_full_frame(self):
+        epd, client = self.make_client()
+        epd.display(None)
+        update = client.get('/updates?since=500').get_json()
+        assert update == {'generation': 1, 'full': True}
+        _, client = self.make_client()
+        assert client.get('/updates?since=500').get_json()['full'] is True
+
+    def test_updates_when_current(self):
+        epd, client = self.make_client()
+        epd.display(None)
+        update = client.get('/updates?since=1').get_json()
+        assert update == {'generation': 1, 'full': False, 'rects': []}
+
+    def test_screen_png_box(self):
+        epd, client = self.make_client()
+        epd.display_Partial(bytes(8), 0, 0, 8, 8)
+        response = client.get('/screen.png?box=0,0,16,8')
+        assert response.status_code == 200
+        window = Image.open(io.BytesIO(response.data))
+        assert window.size == (16, 8)
+        assert window.getpixel((0, 0)) == 0
+        assert window.getpixel((8, 0)) == 255
+
+    def test_screen_png_bad_box(self):
+        _, client = self.make_client()
+        assert client.get('/screen.png?box=0,0,500,8').status_code == 400
+        assert client.get('/screen.png?box=a').status_code == 400
+
+    def test_flask_mode_encodes_nothing_up_front(self):
+        with patch.object(EPD, "init_flask"), \
+             patch.object(EPD, "start_image_update_loop") as loop, \
+             patch.object(EPD, "update_image_bytes") as encode:
+            epd = EPD()
+            epd.display_Partial(bytes(8), 0, 0, 8, 8)
+            epd.display_Partial(bytes(8), 8, 0, 16, 8)
+        loop.assert_not_called()
+        encode.assert_not_called()
+
+    def test_png_encoded_lazily(self):
+        epd, _ = self.make_client()
+        with patch.object(EPD, "update_image_bytes") as encode:
+            epd.display(None)
+            epd.display(None)
+        encode.assert_not_called()
+        assert epd._png_dirty
@@ -0,0 +1,131 @@
+"""Tests for the compact framebuffer storage."""
+
+import pytest
+from PIL import Image, ImageDraw
+from epaper_emulator.framebuffer import (
+    GRAY_LEVELS, PackedFramebuffer, blit_rows, buffer_to_image, dirty_rect, pack_gray,
+    pixels_per_byte, unpack_gray, window_bytes,
+)
+
+
+class TestPackedFramebuffer:
+    def test_stride_pads_rows_to_bytes(self):
+        fb = PackedFramebuffer(10, 3)
+        assert fb.stride == 2
+        assert len(fb) == 6
+
+    def test_clear_matches_pillow_layout(self):
+        fb = PackedFramebuffer(10, 3)
+        assert fb.tobytes() == Image.new('1', (10, 3), 255).tobytes()
+        fb.clear(0)
+        assert fb.tobytes() == Image.new('1', (10, 3), 0).tobytes()
+
+    def test_clear_accepts_color_names(self):
+        fb = PackedFramebuffer(16, 2, fill='black')
+        assert fb.tobytes() == bytes(4)
+        fb.clear('white')
+        assert fb.tobytes() == b'\xff' * 4
+
+    def test_image_round_trip(self):
+        image = Image.new('1', (13, 7), 255)
+        ImageDraw.Draw(image).line((0, 0, 12, 6), fill=0)
+        fb = PackedFramebuffer(13, 7)
+        fb.load_image(image)
+        assert fb.to_image().tobytes() == image.tobytes()
+
+    def test_load_image_rejects_wrong_size(self):
+        fb = PackedFramebuffer(8, 8)
+        with pytest.raises(ValueError):
+            fb.load_image(Image.new('1', (4, 4)))
+
+    def test_load_bytes_rejects_wrong_length(self):
+        fb = PackedFramebuffer(8, 8)
+        with pytest.raises(ValueError):
+            fb.load_bytes(b'\x00' * 7)
+
+
+class TestGrayPacking:
+    def test_pack_gray_layout(self):
+        image = Image.new('L', (8, 1))
+        image.putdata([0x00, 0x80, 0xC0, 0xFF, 0xFF, 0xC0, 0x80, 0x00])
+        # Four pixels per byte, first pixel in the top two bits
+        assert pack_gray(image) == bytes([0b00011011, 0b11100100])
+
+    def test_pack_gray_snaps_to_nearest_level(self):
+        image = Image.new('L', (4, 1))
+        image.putdata([30, 100, 170, 250])
+        assert pack_gray(image) == bytes([0b00011011])
+
+    def test_unpack_gray_round_trip(self):
+        image = Image.new('L', (10, 3))
+        image.putdata([GRAY_LEVELS[i % 4] for i in range(30)])
+        assert unpack_gray(pack_gray(image), (10, 3)).tobytes() == image.tobytes()
+
+
+class TestGrayFramebuffer:
+    def test_stride(self):
+        fb = PackedFramebuffer(10, 3, bits=2)
+        assert fb.stride == 3
+        assert fb.mode == 'L'
+
+    def test_clear_matches_packer(self):
+        fb = PackedFramebuffer(10, 3, bits=2)
+        for fill in (0x00, 0x80, 0xC0, 0xFF):
+            fb.clear(fill)
+            assert fb.tobytes() == pack_gray(Image.new('L', (10, 3), fill))
+
+    def test_image_round_trip(self):
+        image = Image.new('L', (13, 7), 255)
+        ImageDraw.Draw(image).rectangle((2, 2, 9, 5), fill=0x80)
+        fb = PackedFramebuffer(13, 7, bits=2)
+        fb.load_image(image)
+        assert fb.to_image().tobytes() == image.tobytes()
+
+    def test_rejects_unsupported_depth(self):
+        with pytest.raises(ValueError):
+            PackedFramebuffer(8, 8, bits=4)
+
+
+class TestDirtyRect:
+    def test_equal_buffers(self):
+        assert dirty_rect(bytes(8), bytes(8), 16, 4, '1') is None
+
+    def test_monochrome_rect_is_byte_aligned(self):
+        old = Image.new('1', (20, 10), 255)
+        new = old.copy()
+        ImageDraw.Draw(new).point((9, 5), fill=0)
+        assert dirty_rect(old.tobytes(), new.tobytes(), 20, 10, '1') == (8, 5, 16, 6)
+
+    def test_rgb_rect_is_exact(self):
+        old = Image.new('RGB', (20, 10), 'white')
+        new = old.copy()
+        ImageDraw.Draw(new).rectangle((3, 2, 7, 4), fill='red')
+        assert dirty_rect(old.tobytes(), new.tobytes(), 20, 10, 'RGB') == (3, 2, 8, 5)
+
+    def test_last_partial_byte_clamped_to_width(self):
+        old = Image.new('1', (10, 1), 255)
+        new = Image.new('1', (10, 1), 0)
+        assert dirty_rect(old.tobytes(), new.tobytes(), 10, 1, '1') == (0, 0, 10, 1)
+
+
+class TestWindows:
+    def test_pixels_per_byte(self):
+        assert pixels_per_byte('1') == 8
+        assert pixels_per_byte('L') == 4
+        assert pixels_per_byte('RGB') == 0
+
+    def test_blit_rows_copies_window(self):
+        frame = bytearray(b"\xff" * 12)  # 3 bytes x 4 rows
+        blit_rows(frame, 3, b"\x00\x01\x02\x03", 2, 1, 1)
+        assert frame == bytearray(b"\xff\xff\xff\xff\x00\x01\xff\x02\x03\xff\xff\xff")
+
+    def test_buffer_to_image_round_trips(self):
+        image = Image.new('L', (8, 2), GRAY_LEVELS[1])
+        assert buffer_to_image(pack_gray(image), (8, 2), 'L').tobytes() == image.tobytes()
+        mono = Image.new('1', (8, 2), 0)
+        assert buffer_to_image(mono.tobytes(), (8, 2), '1').tobytes() == mono.tobytes()
+
+    def test_window_bytes_matches_crop(self):
+        image = Image.effect_noise((20, 6), 100).convert('1')
+        box = (8, 1, 20, 5)
+        assert window_bytes(image.tobytes(), 3, box, '1') == image.crop(box).tobytes()
@@ -0,0 +1,122 @@
+"""Tests for session recording and replay."""
+
+import os
+import time
+from unittest.mock import patch
+import pytest
+from epaper_emulator.recording import FrameReader, FrameRecorder, replay
+from tests.test_epd import make_epd
+
+
+def frames(count, size=64):
+    return [bytes([i]) * (size // 2) + bytes(range(size // 2)) for i in range(count)]
+
+
+class TestRecordingFormat:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        data = frames(10)
+        with FrameRecorder(path, 16, 32, "1", 64, model="epd2in13", keyframe_interval=4) as rec:
+            for i, frame in enumerate(data):
+                rec.record(frame, timestamp=i * 0.5)
+        with FrameReader(path) as reader:
+            assert (reader.width, reader.height, reader.mode, reader.model) == (16, 32, "1", "epd2in13")
+            assert len(reader) == 10
+            assert [buf for _, buf in reader] == data
+            assert reader.timestamps[3] == 1.5
+
+    def test_random_access(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        data = frames(20)
+        with FrameRecorder(path, 16, 32, "1", 64, keyframe_interval=5) as rec:
+            for frame in data:
+                rec.record(frame)
+        with FrameReader(path) as reader:
+            for i in (17, 3, 9, 10, 0, 19):
+                assert reader.frame(i) == data[i]
+            with pytest.raises(IndexError):
+                reader.frame(20)
+
+    def test_index_at(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        with FrameRecorder(path, 16, 32, "1", 64) as rec:
+            for i, frame in enumerate(frames(4)):
+                rec.record(frame, timestamp=float(i))
+        with FrameReader(path) as reader:
+            assert reader.index_at(2.5) == 2
+            assert reader.index_at(-1) == 0
+            assert reader.index_at(99) == 3
+
+    def test_deltas_are_compact(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        frame = os.urandom(4000)
+        with FrameRecorder(path, 160, 200, "1", 4000) as rec:
+            for _ in range(50):
+                rec.record(frame)
+        # One incompressible keyframe, then near-empty deltas
+        assert os.path.getsize(path) < 4000 + 50 * 100
+
+    def test_unclosed_recording_is_scanned(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        data = frames(6)
+        rec = FrameRecorder(path, 16, 32, "1", 64, keyframe_interval=4)
+        for frame in data:
+            rec.record(frame)
+        # Simulate a crash: flush the frames but never write the index
+        rec._queue.put(None)
+        rec._thread.join()
+        rec._file.write(b"\x01\x02")  # partial record
+        rec._file.close()
+        with FrameReader(path) as reader:
+            assert len(reader) == 6
+            assert reader.frame(5) == data[5]
+
+    def test_rejects_wrong_frame_size(self, tmp_path):
+        with FrameRecorder(str(tmp_path / "s.epdrec"), 16, 32, "1", 64) as rec:
+            with pytest.raises(ValueError):
+                rec.record(b"\x00" * 10)
+
+    def test_writer_errors_are_raised(self, tmp_path):
+        rec = FrameRecorder(str(tmp_path / "s.epdrec"), 16, 32, "1", 64, max_pending=2)
+        with patch.object(FrameRecorder, "_write_frame", side_effect=OSError("disk full")):
+            rec.record(frames(1)[0])
+            deadline = time.monotonic() + 5
+            while rec._error is None and time.monotonic() < deadline:
+                time.sleep(0.001)
+            with pytest.raises(OSError, match="disk full"):
+                rec.record(frames(1)[0])
+        with pytest.raises(OSError, match="disk full"):
+            rec.close()
+
+    def test_queue_is_bounded(self, tmp_path):
+        with FrameRecorder(str(tmp_path / "s.epdrec"), 16, 32, "1", 64, max_pending=3) as rec:
+            assert rec._queue.maxsize == 3
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "other.bin"
+        path.write_bytes(b"x" * 100)
+        with pytest.raises(ValueError):
+            FrameReader(str(path))
+
+
+class TestEPDRecording:
+    def test_record_and_replay(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        epd = make_epd()
+        epd.start_recording(path)
+        epd.draw_rectangle((0, 0, 50, 50), fill=0)
+        epd.draw_line((0, 100, 100, 100), fill=0, width=3)
+        epd.stop_recording()
+        expected = epd.get_frame_buffer(None)
+
+        other = make_epd()
+        assert replay(path, other, speed=None) == 3
+        assert other.get_frame_buffer(None) == expected
+
+    def test_replay_rejects_mismatched_display(self, tmp_path):
+        path = str(tmp_path / "session.epdrec")
+        epd = make_epd()
+        epd.start_recording(path)
+        epd.stop_recording()
+        with pytest.raises(ValueError):
+            replay(path, make_epd(config_file="epd7in5"), speed=None)
@@ -0,0 +1,166 @@
+"""Tests for split-panel segments."""
+
+import io
+from unittest.mock import patch
+import pytest
+from PIL import Image
+from epaper_emulator.emulator import EPD
+from epaper_emulator.segments import SegmentedPanel
+from tests.test_epd import make_client, make_epd
+
+BOXES = {"A": [0, 0, 16, 4], "B": [16, 0, 20, 4], "C": [0, 4, 20, 8]}
+
+
+def make_split_epd(**kwargs):
+    return make_epd(config_file="epd12in48", **kwargs)
+
+
+class TestSegmentedPanel:
+    def test_segments_keep_config_order(self):
+        panel = SegmentedPanel(BOXES, 20, 8, "1")
+        assert [segment.name for segment in panel] == ["A", "B", "C"]
+        assert panel["B"].stride == 1
+        assert panel["C"].stride == 3
+
+    @pytest.mark.parametrize("boxes", [
+        {"A": [0, 0, 21, 4]},
+        {"A": [0, 0, 0, 4]},
+        {"A": [4, 0, 16, 4]},
+        {"A": [0, 0, 12, 4]},
+        {"A": [0, 0, 16, 4], "B": [8, 2, 16, 8]},
+        {},
+    ])
+    def test_rejects_bad_boxes(self, boxes):
+        with pytest.raises(ValueError):
+            SegmentedPanel(boxes, 20, 8, "1")
+
+    def test_unknown_segment(self):
+        with pytest.raises(ValueError, match="Unknown segment"):
+            SegmentedPanel(BOXES, 20, 8, "1")["D"]
+
+    def test_sync_tracks_changes_per_segment(self):
+        panel = SegmentedPanel(BOXES, 20, 8, "1")
+        frame = Image.new("1", (20, 8), 255)
+        assert len(panel.sync(lambda box: frame.crop(box).tobytes())) == 3
+        frame.putpixel((17, 1), 0)
+        panel.mark()
+        changed = panel.sync(lambda box: frame.crop(box).tobytes())
+        assert [segment.name for segment in changed] == ["B"]
+        assert [segment.generation for segment in panel] == [1, 2, 1]
+
+    def test_sync_only_extracts_marked_segments(self):
+        panel = SegmentedPanel(BOXES, 20, 8, "1")
+        panel.sync(lambda box: bytes(len(panel.at_box(box).buffer)))
+        assert [segment.name for segment in panel.mark((0, 5, 4, 6))] == ["C"]
+        boxes = []
+        panel.sync(lambda box: boxes.append(box) or bytes(len(panel.at_box(box).buffer)))
+        assert boxes == [(0, 4, 20, 8)]
+        assert panel.sync(lambda box: pytest.fail("nothing is stale")) == []
+
+    def test_png_cached_per_generation(self):
+        panel = SegmentedPanel(BOXES, 20, 8, "1")
+        segment = panel["A"]
+        png = segment.png()
+        assert segment.png() is png
+        segment.update(b"\xff" * len(segment.buffer))
+        assert segment.png() != png
+        assert Image.open(io.BytesIO(segment.png())).size == (16, 4)
+
+    def test_encode_runs_all_segments(self):
+        panel = SegmentedPanel(BOXES, 20, 8, "1")
+        pngs = panel.encode()
+        assert [Image.open(io.BytesIO(png)).size for png in pngs] == [(16, 4), (4, 4), (20, 4)]
+        panel.close()
+        assert len(panel.encode()) == 3
+        panel.close()
+
+
+class TestSplitPanelEPD:
+    def test_config_defines_four_segments(self):
+        epd = make_split_epd()
+        assert [segment.name for segment in epd.segments] == ["S2", "M2", "M1", "S1"]
+        assert epd.get_segment_buffer("M1") == b"\xff" * (81 * 492)
+
+    def test_other_models_are_not_split(self):
+        epd = make_epd()
+        assert epd.segments is None
+        with pytest.raises(ValueError):
+            epd.display_segment("M1", b"")
+
+    def test_reversed_orientation_is_not_split(self):
+        assert make_split_epd(reverse_orientation=True).segments is None
+
+    @pytest.mark.parametrize("kwargs", [{}, {"compact": True}, {"use_color": True}])
+    def test_display_segment_updates_only_that_segment(self, kwargs):
+        epd = make_split_epd(**kwargs)
+        epd.get_segment_buffer("S1")
+        generations = {segment.name: segment.generation for segment in epd.segments}
+        image = Image.new(epd.image_mode, (656, 492), 0)
+        with patch.object(EPD, "_push") as push:
+            epd.display_segment("S1", epd.getbuffer(image))
+        push.assert_called_once_with((648, 492, 1304, 984))
+        assert epd.get_segment_buffer("S1") == epd.getbuffer(image)
+        assert epd.image.convert("L").getpixel((648, 492)) == 0
+        assert epd.image.convert("L").getpixel((647, 983)) == 255
+        epd._sync_segments()
+        for segment in epd.segments:
+            assert segment.generation == generations[segment.name] + (segment.name == "S1")
+
+    def test_display_segment_checks_length(self):
+        epd = make_split_epd()
+        with pytest.raises(ValueError):
+            epd.display_segment("S2", bytes(10))
+
+    def test_window_pushes_its_part_of_each_segment(self):
+        epd = make_split_epd(compact=True)
+        with patch.object(EPD, "_push") as push:
+            epd.display_Partial(bytes(3 * 10), 640, 10, 664, 20)
+        assert [call.args[0] for call in push.call_args_list] == [(640, 10, 648, 20), (648, 10, 664, 20)]
+        assert epd.get_segment_buffer("S2") + epd.get_segment_buffer("M2") != b"\xff" * (163 * 492)
+
+    def test_full_display_pushes_segment_boxes(self):
+        epd = make_split_epd()
+        with patch.object(EPD, "_push") as push:
+            epd.display(None)
+        assert [call.args[0] for call in push.call_args_list] == [segment.box for segment in epd.segments]
+
+    def test_small_window_is_not_widened(self):
+        epd = make_split_epd()
+        client = make_client(epd)
+        since = client.get('/updates?since=-1').get_json()['generation']
+        with patch.object(EPD, "_current_window") as extract:
+            epd.display_Partial(bytes(2 * 16), 8, 8, 24, 24)
+            update = client.get(f'/updates?since={since}').get_json()
+        assert update['rects'] == [[8, 8, 24, 24]]
+        extract.assert_not_called()
+
+    def test_display_defers_extraction(self):
+        epd = make_split_epd()
+        with patch.object(EPD, "_current_window") as extract:
+            epd.draw_rectangle((0, 0, 10, 10), fill=0)
+            epd.display(None)
+        extract.assert_not_called()
+        assert all(segment.stale for segment in epd.segments)
+        assert epd.get_segment_buffer("S2")[0] == 0
+        assert not any(segment.stale for segment in epd.segments)
+
+    def test_tkinter_and_headless_push_the_window(self):
+        epd = make_split_epd(headless=True)
+        with patch.object(EPD, "_push") as push:
+            epd.display_Partial(bytes(3 * 10), 640, 10, 664, 20)
+        push.assert_called_once_with((640, 10, 664, 20))
+
+    def test_segment_png_served_from_cache(self):
+        epd = make_split_epd()
+        client = make_client(epd)
+        since = client.get('/updates?since=-1').get_json()['generation']
+        epd.display_segment("M1", bytes(81 * 492))
+        update = client.get(f'/updates?since={since}').get_json()
+        assert update['rects'] == [[0, 492, 648, 984]]
+        with patch.object(EPD, "_frame_region") as region:
+            response = client.get('/screen.png?box=0,492,648,984')
+        region.assert_not_called()
+        assert response.data == epd.segments["M1"].png()
+        window = Image.open(io.BytesIO(response.data))
+        assert window.size == (648, 492)
+        assert window.getpixel((0, 0)) == 0
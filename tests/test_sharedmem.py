@@ -0,0 +1,120 @@
+"""Tests for the shared-memory framebuffer export."""
+
+import pytest
+from epaper_emulator.sharedmem import SharedFramebuffer, SharedFramebufferReader
+from tests.test_epd import make_epd
+
+
+@pytest.fixture
+def shm_path(tmp_path):
+    return str(tmp_path / "epd.shm")
+
+
+class TestSharedFramebuffer:
+    def test_header(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 20, 10, "1")
+        reader = SharedFramebufferReader(shm_path)
+        assert (reader.width, reader.height, reader.mode) == (20, 10, "1")
+        assert reader.stride == 3
+        assert reader.frame_size == 30
+        assert reader.generation == 0
+        reader.close()
+        writer.close()
+
+    def test_generation_is_aligned(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        writer.publish(b"\xff" * 8)
+        with open(shm_path, "rb") as f:
+            header = f.read(64)
+        assert int.from_bytes(header[32:40], "little") == 2
+        assert int.from_bytes(header[40:44], "little") == 0
+        assert int.from_bytes(header[48:52], "little") == 16
+        writer.close()
+
+    def test_publish_and_read(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        reader = SharedFramebufferReader(shm_path)
+        writer.publish(b"\xff" * 8)
+        generation, rect, frame = reader.read()
+        assert generation == 2
+        assert rect == (0, 0, 16, 4)
+        assert frame == b"\xff" * 8
+        assert bytes(reader.data) == frame
+        reader.close()
+        writer.close()
+
+    def test_dirty_rect_tracks_changes(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        reader = SharedFramebufferReader(shm_path)
+        writer.publish(b"\xff" * 8)
+        frame = bytearray(b"\xff" * 8)
+        frame[5] = 0x0F  # row 2, pixels 8..11
+        assert writer.publish(bytes(frame)) == (8, 2, 16, 3)
+        assert reader.dirty_rect == (8, 2, 16, 3)
+        assert reader.generation == 4
+        assert reader.read()[2] == bytes(frame)
+        reader.close()
+        writer.close()
+
+    def test_unchanged_frame_is_not_published(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        writer.publish(bytes(8))
+        assert writer.publish(bytes(8)) is None
+        assert writer.generation == 2
+        writer.close()
+
+    def test_wait_times_out(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        reader = SharedFramebufferReader(shm_path)
+        assert reader.wait(reader.generation, timeout=0.01) is None
+        writer.publish(bytes(8))
+        assert reader.wait(0, timeout=0.01) == 2
+        reader.close()
+        writer.close()
+
+    def test_publish_rows_writes_only_window_rows(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        reader = SharedFramebufferReader(shm_path)
+        writer.publish(b"\xff" * 8)
+        writer.publish_rows((0, 1, 8, 3), b"\x00\xff\x00\xff")
+        assert reader.read() == (4, (0, 1, 8, 3), b"\xff\xff\x00\xff\x00\xff\xff\xff")
+        # Later diffs start from the spliced rows
+        assert writer.publish(b"\xff\xff\x00\xff\x00\xff\xff\xff") is None
+        with pytest.raises(ValueError):
+            writer.publish_rows((0, 1, 8, 3), bytes(3))
+        reader.close()
+        writer.close()
+
+    def test_rejects_wrong_size(self, shm_path):
+        writer = SharedFramebuffer(shm_path, 16, 4, "1")
+        with pytest.raises(ValueError):
+            writer.publish(bytes(3))
+        writer.close()
+
+
+class TestEPDExport:
+    @pytest.mark.parametrize("kwargs", [
+        {}, {"compact": True}, {"use_color": True},
+        {"config_file": "epd2in7", "use_gray": True},
+    ])
+    def test_display_publishes_frame(self, shm_path, kwargs):
+        epd = make_epd(shared_framebuffer=shm_path, **kwargs)
+        reader = SharedFramebufferReader(shm_path)
+        epd.draw_rectangle((10, 20, 30, 40), fill=0)
+        assert reader.read()[2] == epd.get_frame_buffer(None)
+        x0, y0, x1, y1 = reader.dirty_rect
+        assert (y0, y1) == (20, 41)
+        assert x0 <= 10 and x1 >= 31
+        assert reader.to_image().tobytes() == epd.image.tobytes()
+        reader.close()
+        epd.Dev_exit()
+
+    def test_export_survives_recording(self, shm_path, tmp_path):
+        epd = make_epd(shared_framebuffer=shm_path)
+        reader = SharedFramebufferReader(shm_path)
+        epd.start_recording(str(tmp_path / "session.epdrec"))
+        epd.draw_rectangle((0, 0, 10, 10), fill=0)
+        epd.stop_recording()
+        assert reader.read()[2] == epd.get_frame_buffer(None)
+        reader.close()
+        epd.Dev_exit()